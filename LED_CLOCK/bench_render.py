@@ -0,0 +1,46 @@
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+# runs the led clocks against the simulated strip for a few seconds, no pi needed
+# python3 bench_render.py
+os.environ.setdefault("LED_BACKEND", "sim")
+
+from led_thread import LEDClock
+from led_async import AsyncLEDClock
+
+
+def report(name, clock, seconds):
+    sim = clock.strip.stats()
+    intervals = clock.strip.frame_intervals_ms()
+    print(f"{name:<14} shows {sim['shows']:>5} ({sim['shows'] / seconds:.0f}/s)  "
+          f"skipped {clock.frames_skipped:>5}  wire busy {sim['busy_ms']:.1f} ms  "
+          f"show wait {sim['wait_ms']:.1f} ms")
+    if len(intervals) > 1:
+        print(f"{'':<14} frame interval mean {statistics.mean(intervals):.2f} ms  "
+              f"stdev {statistics.stdev(intervals):.2f} ms  max {max(intervals):.2f} ms")
+
+
+def bench_thread(seconds):
+    clock = LEDClock()
+    for target, args in ((clock.breathe, (clock.get_breathing_minute, (0, 255, 0), 0.02)),
+                         (clock.breathe, (clock.get_breathing_hour, (0, 0, 255), 0.02)),
+                         (clock.clock_thread, ())):
+        threading.Thread(target=target, args=args, daemon=True).start()
+    time.sleep(seconds)
+    report("LEDClock", clock, seconds)
+
+
+async def bench_async(seconds):
+    clock = AsyncLEDClock()
+    task = asyncio.ensure_future(clock.start())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    report("AsyncLEDClock", clock, seconds)
+
+
+if __name__ == "__main__":
+    bench_thread(3.0)
+    asyncio.run(bench_async(3.0))
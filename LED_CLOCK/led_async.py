@@ -1,7 +1,12 @@
 import time
 import math
 import asyncio
-from rpi_ws281x import PixelStrip, Color
+import os
+import sys
+# ws281x.py is shared with the reaction game and lives in ../REACTION_GAME.
+# sudo drops PYTHONPATH, so the directory is added here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "REACTION_GAME"))
+from ws281x import PixelStrip, Color
 
 class AsyncLEDClock:
     def __init__(self, led_count=60, led_pin=18, brightness=30):
@@ -16,11 +21,22 @@ class AsyncLEDClock:
         self.breathing_minute = 0
         self.breathing_hour = 0
 
+        # what each led is showing right now. writes of the same color are
+        # dropped so an unchanged frame is never transmitted
+        self.pixels = [Color(0, 0, 0)] * self.strip.numPixels()
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
     # Async-safe setPixelColor
     async def safe_setPixelColor(self, led_num, color):
         async with self.led_lock:
+            if self.pixels[led_num] == color:
+                self.frames_skipped += 1
+                return
+            self.pixels[led_num] = color
             self.strip.setPixelColor(led_num, color)
             self.strip.show()
+            self.frames_shown += 1
 
     # Convert RGB + intensity to Color
     @staticmethod
@@ -101,7 +117,9 @@ class AsyncLEDClock:
         async with self.led_lock:
             for i in range(self.strip.numPixels()):
                 self.strip.setPixelColor(i, Color(0,0,0))
+                self.pixels[i] = Color(0,0,0)
             self.strip.show()
+            self.frames_shown += 1
 
     # Start all tasks
     async def start(self):
@@ -113,6 +131,7 @@ class AsyncLEDClock:
             )
         except KeyboardInterrupt:
             print("Exiting...")
+            print(f"frames shown: {self.frames_shown} skipped: {self.frames_skipped}")
             await self.turn_all_off()
 
 
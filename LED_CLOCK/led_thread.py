@@ -1,7 +1,12 @@
 import time
 import threading
 import math
-from rpi_ws281x import PixelStrip, Color
+import os
+import sys
+# ws281x.py is shared with the reaction game and lives in ../REACTION_GAME.
+# sudo drops PYTHONPATH, so the directory is added here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "REACTION_GAME"))
+from ws281x import PixelStrip, Color
 
 class LEDClock:
     def __init__(self, led_count=60, led_pin=18, brightness=30):
@@ -17,11 +22,22 @@ class LEDClock:
         self.breathing_minute = 0
         self.breathing_hour = 0
 
+        # what each led is showing right now. writes of the same color are
+        # dropped so an unchanged frame is never transmitted
+        self.pixels = [Color(0, 0, 0)] * self.strip.numPixels()
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
     # Thread-safe setPixelColor
     def safe_setPixelColor(self, led_num, color):
         with self.led_lock:
+            if self.pixels[led_num] == color:
+                self.frames_skipped += 1
+                return
+            self.pixels[led_num] = color
             self.strip.setPixelColor(led_num, color)
             self.strip.show()
+            self.frames_shown += 1
 
     # Convert RGB + intensity to Color
     @staticmethod
@@ -105,7 +121,9 @@ class LEDClock:
         with self.led_lock:
             for i in range(self.strip.numPixels()):
                 self.strip.setPixelColor(i, Color(0, 0, 0))
+                self.pixels[i] = Color(0, 0, 0)
             self.strip.show()
+            self.frames_shown += 1
 
     # Start all threads
     def start(self):
@@ -126,6 +144,7 @@ class LEDClock:
                 time.sleep(1)
         except KeyboardInterrupt:
             print("Exiting...")
+            print(f"frames shown: {self.frames_shown} skipped: {self.frames_skipped}")
             self.turn_all_off()
 
 
@@ -1,9 +1,24 @@
+import os
 import time
 import threading
 import math
-from rpi_ws281x import PixelStrip, Color
-from TouchSensor import MCP23017TouchLED
-import random
+from contextlib import contextmanager
+import numpy as np
+from ws281x import PixelStrip, Color, US_PER_LED, RESET_US
+from TouchSensor import MCP23017TouchLED, LOCKOUT
+from scheduler import Scheduler
+from gestures import GestureEngine, Chord
+from reaction_stats import ReactionTracker
+from session_store import SessionStore
+from difficulty import FixedDifficulty, AdaptiveDifficulty
+from game_modes import ReactionMode, MODES
+
+# Compositor layers, bottom to top. a lit pixel on a higher layer covers the
+# ones below it, and when it is cleared or expires the lower color shows again
+BASE_LAYER = 0      # game targets
+OVERLAY_LAYER = 1   # short feedback like the red wrong-touch blink
+SYSTEM_LAYER = 2    # reset flash and anything that must cover the game
+LAYER_COUNT = 3
 
 class LedStrip:
     def __init__(self, led_count=60, led_pin=18, brightness=30):
@@ -12,214 +27,830 @@ class LedStrip:
         self.strip.begin()
         self.led_count = led_count
         self._lock = threading.Lock()
-        #monitor what's on and off
-        self.state = [False] * self.led_count  # False = OFF, True = ON
 
-    def set_pixel(self, index, color):
+        # one packed 0xWWRRGGBB color per led per layer, same as Color()
+        self.layers = np.zeros((LAYER_COUNT, self.led_count), dtype=np.uint32)
+        # which pixels a layer covers. the base layer always covers everything
+        self._active = np.zeros((LAYER_COUNT, self.led_count), dtype=bool)
+        self._active[BASE_LAYER] = True
+        # monotonic time a pixel drops off its layer, inf = stays until cleared
+        self._expires = np.full((LAYER_COUNT, self.led_count), np.inf)
+
+        # back buffer. the layers blended together, pushed to the strip on commit
+        self.framebuffer = np.zeros(self.led_count, dtype=np.uint32)
+        # what the strip currently holds, used to push only the changed leds
+        self._shown = np.zeros(self.led_count, dtype=np.uint32)
+        # monotonic_ns when each led last changed on the strip, give or take
+        # shown_window_ns / 2. the data goes out somewhere during show(), and
+        # the leds latch once the whole strip has been clocked through
+        self.shown_ns = np.zeros(self.led_count, dtype=np.int64)
+        self.shown_window_ns = np.zeros(self.led_count, dtype=np.int64)
+        self.transfer_ns = (US_PER_LED * self.led_count + RESET_US) * 1000
+        # write_seq counts writes, shown_seq is the write_seq the last
+        # finished frame was composed at. once shown_seq >= a write's seq
+        # the strip holds that write, even if it changed no led (a target
+        # turned off and on again within one frame)
+        self.write_seq = 0
+        self.shown_seq = 0
+        self._dirty = False
+        self._frame_depth = 0
+        # only one show() on the wire at a time
+        self._show_lock = threading.Lock()
+
+        # auto-commit render loop (off by default, see start_render_loop)
+        self._scheduler = None
+        self._own_scheduler = False
+        self._render_timer = None
+        self.max_fps = 60
+        self._last_show = 0.0
+        # frames actually sent to the strip vs. dropped because nothing changed
+        self.frames_shown = 0
+        self.frames_skipped = 0
+
+    #monitor what's on and off
+    @property
+    def state(self):
+        """Bool array of what the strip shows, False = OFF, True = ON."""
+        return self._shown != 0
+
+    def get_pixel(self, index, layer=BASE_LAYER):
+        return int(self.layers[layer][index])
+
+    def shown_color(self, index):
+        """Color the strip holds for a led, all layers blended."""
+        return int(self._shown[index])
+
+    def set_pixel(self, index, color, layer=BASE_LAYER, duration=None):
+        """Set one led on a layer. duration (seconds) makes it drop off by itself."""
         if 0 <= index < self.led_count:
-            with self._lock:
-                self.strip.setPixelColor(index, color)
-                self.state[index] = (color != Color(0, 0, 0))
-                self.strip.show()
+            self._write(layer, index, color, duration)
 
     def turn_off_pixel(self, index):
         self.set_pixel(index, Color(0, 0, 0))
 
     def turn_all(self, color):
+        self.fill(color)
+
+    # Bulk operations on a layer. none of these loop in python
+    def fill(self, color, layer=BASE_LAYER, duration=None):
+        self._write(layer, slice(None), color, duration)
+
+    def fill_range(self, start, stop, color, layer=BASE_LAYER, duration=None):
+        """Set leds start..stop-1 (clipped to the strip)."""
+        start = max(0, start)
+        stop = min(self.led_count, stop)
+        if start >= stop:
+            return
+        self._write(layer, slice(start, stop), color, duration)
+
+    def fill_mask(self, mask, color, layer=BASE_LAYER, duration=None):
+        """Set every led where mask (bool array of led_count) is True."""
+        self._write(layer, np.asarray(mask, dtype=bool), color, duration)
+
+    def copy_from(self, colors, offset=0, layer=BASE_LAYER, duration=None):
+        """Copy an array of packed colors into a layer starting at offset."""
+        colors = np.asarray(colors, dtype=np.uint32)
+        stop = min(self.led_count, offset + len(colors))
+        if offset >= stop:
+            return
+        self._write(layer, slice(offset, stop), colors[:stop - offset], duration)
+
+    def clear_layer(self, layer, index=None):
+        """Uncover a pixel (or the whole layer) so the layers below show through."""
+        if layer == BASE_LAYER:
+            if index is None:
+                self.fill(Color(0, 0, 0))
+            else:
+                self.turn_off_pixel(index)
+            return
+        where = slice(None) if index is None else index
         with self._lock:
-            for i in range(self.led_count):
-                self.strip.setPixelColor(i, color)
-                self.state[i] = (color != Color(0, 0, 0))
-            self.strip.show()
+            self._active[layer][where] = False
+            self._expires[layer][where] = np.inf
+            flush = self._mark_dirty()
+        if flush:
+            self._flush()
+
+    def diff(self):
+        """Indices of leds that differ from what was last pushed to the strip."""
+        with self._lock:
+            # composed into a copy, a query must not drop expired pixels
+            # behind the render loop's back
+            frame = np.empty_like(self.framebuffer)
+            self._compose(time.monotonic(), frame)
+            return np.flatnonzero(frame != self._shown)
 
     def turn_all_off(self):
         self.turn_all(Color(0, 0, 0))
 
+    def _write(self, layer, where, color, duration):
+        with self._lock:
+            self.layers[layer][where] = color
+            if layer != BASE_LAYER:
+                self._active[layer][where] = True
+                if duration is None:
+                    self._expires[layer][where] = np.inf
+                else:
+                    self._expires[layer][where] = time.monotonic() + duration
+            flush = self._mark_dirty()
+        if flush:
+            self._flush()
+
+    def _compose(self, now, out=None):
+        """Called with _lock held. Blend the layers into framebuffer, dropping expired pixels.
+
+        With out, blend into that instead and leave the layers as they are.
+        """
+        expired = self._expires <= now
+        active = self._active
+        if out is None:
+            out = self.framebuffer
+            if expired.any():
+                self._active[expired] = False
+                self._expires[expired] = np.inf
+        else:
+            active = active & ~expired
+        out[:] = self.layers[BASE_LAYER]
+        for layer in range(BASE_LAYER + 1, LAYER_COUNT):
+            covered = active[layer]
+            out[covered] = self.layers[layer][covered]
+
+    def _next_expiry(self):
+        """Called with _lock held. Earliest time a timed pixel drops off, or inf."""
+        return float(self._expires.min())
+
+    # Frames
+    # writes between begin_frame() and commit() go out in a single show()
+    # eg.
+    # with led_strip.frame():
+    #     led_strip.turn_off_pixel(15)
+    #     led_strip.set_pixel(19, led_strip.green())
+    def begin_frame(self):
+        with self._lock:
+            self._frame_depth += 1
+
+    def commit(self):
+        """End a frame. Shows it now, or hands it to the render loop if one is running."""
+        with self._lock:
+            if self._frame_depth > 0:
+                self._frame_depth -= 1
+            flush = self._dirty and self._frame_depth == 0
+            if flush and self._scheduler is not None:
+                self._request_render(self._last_show + 1.0 / self.max_fps)
+                flush = False
+        if flush:
+            self._flush()
+
+    @contextmanager
+    def frame(self):
+        self.begin_frame()
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    def _mark_dirty(self):
+        """Called with _lock held. Returns True if the caller should show() right away."""
+        self._dirty = True
+        self.write_seq += 1
+        if self._scheduler is not None:
+            if self._frame_depth == 0:
+                self._request_render(self._last_show + 1.0 / self.max_fps)
+            return False
+        return self._frame_depth == 0
+
+    def _flush(self):
+        """Blend the layers, push the changed leds to the strip and show it."""
+        with self._show_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                seq = self.write_seq
+                self._compose(time.monotonic())
+                changed = np.flatnonzero(self.framebuffer != self._shown)
+                self._dirty = False
+                if len(changed) == 0:
+                    # written but same as what's already lit, no need to transmit
+                    self.frames_skipped += 1
+                    self.shown_seq = seq
+                    return
+                colors = self.framebuffer[changed]
+                self._shown[changed] = colors
+            # untouched leds keep their value in the PixelStrip buffer,
+            # so only the changed ones are copied over before the transfer
+            for i, color in zip(changed.tolist(), colors.tolist()):
+                self.strip.setPixelColor(i, color)
+            start_ns = time.monotonic_ns()
+            self.strip.show()
+            end_ns = time.monotonic_ns()
+            self.shown_ns[changed] = (start_ns + end_ns) // 2 + self.transfer_ns
+            self.shown_window_ns[changed] = end_ns - start_ns
+            self.shown_seq = seq
+            self._last_show = time.monotonic()
+            self.frames_shown += 1
+
+    # Render loop
+    # set_pixel() only marks the frame dirty and a scheduler timer shows it,
+    # at most max_fps times a second no matter how many pixels changed.
+    # a timer is also set for when the next timed pixel expires, so overlays
+    # with a duration need the render loop running to disappear on time.
+    # pass the station's Scheduler to share its thread, otherwise one is started
+    def start_render_loop(self, max_fps=60, scheduler=None):
+        with self._lock:
+            if self._scheduler is not None:
+                return
+            self.max_fps = max_fps
+            self._own_scheduler = scheduler is None
+            if scheduler is None:
+                scheduler = Scheduler()
+                scheduler.start()
+            self._scheduler = scheduler
+            if self._dirty or self._next_expiry() != np.inf:
+                self._request_render(time.monotonic())
+
+    def stop_render_loop(self):
+        with self._lock:
+            scheduler = self._scheduler
+            if scheduler is None:
+                return
+            if self._render_timer is not None:
+                self._render_timer.cancel()
+                self._render_timer = None
+            self._scheduler = None
+        if self._own_scheduler:
+            scheduler.stop()
+        # push whatever was written after the last frame
+        self._flush()
+
+    def _request_render(self, at):
+        """Called with _lock held. Make sure a render runs no later than at."""
+        if self._render_timer is not None:
+            if self._render_timer.deadline <= at:
+                return
+            self._render_timer.cancel()
+        self._render_timer = self._scheduler.call_at(at, self._render)
+
+    def _render(self):
+        with self._lock:
+            self._render_timer = None
+            if self._scheduler is None or self._frame_depth > 0:
+                # stopped, or a frame is open and commit() will ask again
+                return
+            if self._next_expiry() <= time.monotonic():
+                self._dirty = True
+        self._flush()
+        with self._lock:
+            if self._scheduler is None:
+                return
+            if self._dirty:
+                # written while we were showing
+                self._request_render(self._last_show + 1.0 / self.max_fps)
+            expiry = self._next_expiry()
+            if expiry != np.inf:
+                self._request_render(max(expiry, self._last_show + 1.0 / self.max_fps))
+
     # Color helpers
     def red(self): return Color(255, 0, 0)
     def green(self): return Color(0, 255, 0)
     def blue(self): return Color(0, 0, 255)
 
+# Game states. the game is driven by events on the scheduler thread
+# (a press, a timer firing, a reset) instead of a thread polling a flag,
+# so nothing wakes up while a round waits for the player.
+# what each round asks for comes from the game mode's schedule, see
+# game_modes.py, the states are the same for every mode.
+#
+# IDLE -> ARMED      start(), or a new game after the last round / a reset
+# ARMED -> WAITING   the step's gap ran out, targets lit
+# ARMED -> SHOWING   same, for a step that shows its targets one by one
+# SHOWING -> WAITING the last one was shown, the player repeats them
+# WAITING -> SCORING every target hit, the step timed out, or a wrong
+#                    touch in an ordered step
+# SCORING -> ARMED   next round, or a new game after the last one
+# any -> RESETTING   start/reset combo held, back to ARMED after the flash
+# ARMED/SHOWING/WAITING <-> PAUSED   pause combo held (if set), the round starts over on resume
+# any -> IDLE        stop()
+IDLE = "idle"
+ARMED = "armed"
+SHOWING = "showing"
+WAITING = "waiting"
+SCORING = "scoring"
+RESETTING = "resetting"
+PAUSED = "paused"
+
+
 class TouchConsumer2:
-    def __init__(self, led_strip, strip_led_pins, debounce_ms=300, tries=10):
+    def __init__(self, led_strip, strip_led_pins, debounce_ms=300, tries=10, scheduler=None,
+                 max_gap=3.0, store=None, player="guest", difficulty=None, mode=None,
+                 pause_combo=None):
         self.led_strip = led_strip
         self.strip_led_pins = strip_led_pins
         self.debounce_ms = debounce_ms
+        # monotonic_ns of the last accepted press per sensor
         self.last_touch = [0] * len(strip_led_pins)
 
-        # Track which LED is currently active
+        # the step being played and the one after it, see game_modes.py.
+        # _remaining has a bit per sensor still to hit, _expect is the next
+        # position in an ordered step. current_led_index is the first
+        # target lit this round
+        self.state = IDLE
+        self.step = None
+        self._next_step = None
+        self._replay_step = None
+        self._schedule = None
+        self._remaining = 0
+        self._expect = 0
         self.current_led_index = None
-        self.led_pressed_event = threading.Event()
+        # monotonic_ns and window of the last hit this round, the next
+        # target's reaction counts from there if it was lit before it
+        self._last_hit_ns = 0
+        self._last_hit_window_ns = 0
+        # monotonic_ns when the current target was set, and the strip's
+        # write_seq once it was, see _target_visible()
+        self._target_set_ns = 0
+        self._target_seq = 0
         self.reaction_time = None
+        # +/- of reaction_time, from the led and touch timestamps
+        self.reaction_uncertainty = None
         self.total_reaction_time = 0.0
         self.total_wrong_touches = 0
-
-        #start/reset 
+        # presses on a target that wasn't on the strip yet
+        self.total_early_touches = 0
+        # targets not hit before their step timed out or failed
+        self.total_misses = 0
+        # hits timed before their led went on, not counted as trials
+        self.measurement_errors = 0
+        # running stats per sensor, per game (session) and overall
+        self.stats = ReactionTracker()
+        # every trial also goes to the SessionStore if there is one
+        self.store = store
+        self.player = player
+        self._session = None
+        self._round_wrong_touches = 0
+        self.round = 0
+        # random wait before each target, 0 to max_gap seconds
+        self.max_gap = max_gap
+        # gap, targets and how many at once, see difficulty.py. the default
+        # keeps the original rules, pass AdaptiveDifficulty(consumer.stats, ...)
+        # (or "adaptive") to follow the player
+        self.set_difficulty(difficulty or FixedDifficulty(len(strip_led_pins), max_gap))
+        # what the game asks the player to do, the reaction game by default.
+        # a mode picked by name plays tries rounds too
+        self._tries = tries
+        self.set_mode(mode or ReactionMode(tries))
+        self.rng = np.random.default_rng()
+        self.reset_flash = 0.2
+
+        if scheduler is None:
+            scheduler = Scheduler()
+            scheduler.start()
+        self.scheduler = scheduler
+        # the red blink and the reset flash are timed overlay pixels, they
+        # only go away with a render loop. does nothing if one is running
+        led_strip.start_render_loop(scheduler=scheduler)
+
+        #operator gestures, see gestures.py. every touch goes through the
+        #engine before the game sees it, more can be added with add_gesture()
+        self.gestures = GestureEngine(scheduler)
+        #start/reset: hold sensors 0 and 1 for 1 sec
         self.start_combo = (0,1)
-        self.start_hold_time = 1.0 # 1 sec of hold time
-        self.start_press_time = None
+        self.start_hold_time = 1.0
+        self.gestures.add(Chord(self.start_combo, hold=self.start_hold_time), self._reset_game)
+        #pause/resume: off unless asked for, eg. pause_combo=(2, 3) to hold
+        #sensors 2 and 3 for 1 sec. a resting hand would pause the game
+        self.pause_combo = pause_combo
+        if pause_combo is not None:
+            self.gestures.add(Chord(pause_combo, hold=1.0), self._toggle_pause)
+
+        # the one pending round timer (gap, show, step timeout or reset
+        # flash) and the end of a timed game, both cancelled on reset
+        self._timer = None
+        self._game_timer = None
+        # seconds left of a timed game while paused
+        self._game_left = None
+
+        self.start()
+
+    @property
+    def targets(self):
+        """led index -> sensor index of the targets still to hit this round."""
+        step = self.step
+        if step is None or self.state not in (SHOWING, WAITING):
+            return {}
+        if step.ordered:
+            return dict(zip(step.leds[self._expect:], step.targets[self._expect:]))
+        return {led: sensor for led, sensor in zip(step.leds, step.targets)
+                if self._remaining >> sensor & 1}
+
+    # State machine
+    # the state methods below only ever run on the scheduler thread, so the
+    # game state needs no lock. on_touch is the one way in from another
+    # thread and it hands the press over with call_soon
+    def start(self):
+        self.scheduler.call_soon(self._new_game)
+
+    def stop(self):
+        self.scheduler.call_soon(self._stop)
+
+    def _stop(self):
+        self._cancel_timer()
+        self._cancel_game_timer()
+        self._end_session()
+        self._clear_targets()
+        self.state = IDLE
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _cancel_game_timer(self):
+        if self._game_timer is not None:
+            self._game_timer.cancel()
+            self._game_timer = None
+
+    def _new_game(self):
+        self.round = 0
+        self.total_reaction_time = 0.0
+        self.total_wrong_touches = 0
+        self.total_early_touches = 0
+        self.total_misses = 0
+        self.stats.start_session()
+        self._round_wrong_touches = 0
+        if self.store is not None:
+            self._session = self.store.start_session(self.player, self.tries)
+        self.reaction_time = None
+        self.reaction_uncertainty = None
+
+        # the whole game is drawn here, rounds only read the next step
+        self._schedule = iter(self.mode.schedule(len(self.strip_led_pins), self.rng,
+                                                 self.difficulty))
+        self._replay_step = None
+        self._next_step = self._read_step()
+        self._cancel_game_timer()
+        self._game_left = None
+        if self.mode.duration_s is not None:
+            self._game_timer = self.scheduler.call_later(self.mode.duration_s, self._time_up)
+        self._arm()
+
+    def _read_step(self):
+        step = next(self._schedule, None)
+        if step is not None and step.leds is None:
+            step.compile(self.strip_led_pins)
+        return step
+
+    def _arm(self):
+        """Wait the next step's gap, then light its targets."""
+        self.state = ARMED
+        self._remaining = 0
+        self.current_led_index = None
+        if self._replay_step is not None:
+            # a paused round starts over
+            self.step, self._replay_step = self._replay_step, None
+        else:
+            self.step = self._next_step
+        if self.step is None:
+            self._end_game()
+            return
+        self._timer = self.scheduler.call_later(self.step.gap, self._light_target)
 
-        #combo to reset. onTouch() is called separately so we need a thread to keep a track
-        self.sensor_pressed = [False] * len(strip_led_pins)
-        self.combo_thread = threading.Thread(target=self._combo_monitor)
-        self.combo_thread.daemon = True
-        self.combo_thread.start()
+    def _light_target(self):
+        self._timer = None
+        if self.state != ARMED:
+            return
+        step = self.step
+        self._expect = 0
+        self._last_hit_ns = 0
+        self._last_hit_window_ns = 0
+        self.current_led_index = step.leds[0]
+        if step.show_s:
+            self.state = SHOWING
+            self._show(0)
+        else:
+            self._wait_for_touches()
+            with self.led_strip.frame():
+                for led_index in step.leds:
+                    self.led_strip.set_pixel(led_index, self.led_strip.green())
+            self._target_seq = self.led_strip.write_seq
+            print(f"[GAME] LED {', '.join(map(str, step.leds))} ON")
+        # the round after this one is read now, while the player reacts
+        if step is self._next_step:
+            self._next_step = self._read_step()
+
+    def _show(self, position):
+        step = self.step
+        if position == len(step.leds):
+            self._wait_for_touches()
+            # the first repeat counts from the end of the show
+            self._last_hit_ns = self._target_set_ns
+            print(f"[GAME] repeat {len(step.leds)}")
+            return
+        # shown on the overlay so the base layer (what has to be hit) stays empty
+        self.led_strip.set_pixel(step.leds[position], self.led_strip.green(),
+                                 layer=OVERLAY_LAYER, duration=step.show_s * 0.8)
+        self._timer = self.scheduler.call_later(step.show_s, self._show, position + 1)
+
+    def _wait_for_touches(self):
+        self.state = WAITING
+        self._remaining = self.step.mask
+        self._target_set_ns = time.monotonic_ns()
+        if self.step.timeout is not None:
+            self._timer = self.scheduler.call_later(self.step.timeout, self._timed_out)
+
+    def _clear_targets(self):
+        with self.led_strip.frame():
+            for led_index in self.targets:
+                self.led_strip.turn_off_pixel(led_index)
+        self._remaining = 0
+        self.current_led_index = None
 
-        #restart the game
-        self.running = True
-        self.tries = tries
+    def _toggle_pause(self):
+        if self.state == PAUSED:
+            print("[GAME] Resumed")
+            if self._game_left is not None:
+                self._game_timer = self.scheduler.call_later(self._game_left, self._time_up)
+                self._game_left = None
+            self._arm()
+        elif self.state in (ARMED, SHOWING, WAITING):
+            print("[GAME] Paused")
+            self._cancel_timer()
+            if self._game_timer is not None:
+                self._game_left = max(0.0, self._game_timer.deadline - time.monotonic())
+                self._cancel_game_timer()
+            if self.state != ARMED:
+                self._replay_step = self.step
+            self._clear_targets()
+            self.state = PAUSED
+
+    def _on_press(self, sensor_index, timestamp_ns, window_ns):
+        if self.state not in (ARMED, WAITING):
+            return
+        led_index = self.strip_led_pins[sensor_index]
+        step = self.step
+
+        if self.state == WAITING:
+            if step.ordered:
+                if step.targets[self._expect] == sensor_index:
+                    self._expect += 1
+                    self._score(sensor_index, timestamp_ns, window_ns)
+                    return
+            elif self._remaining >> sensor_index & 1:
+                if not self._target_visible(led_index):
+                    # touched before the target made it onto the strip
+                    self.total_early_touches += 1
+                    print(f"[GAME] Too early ({self.total_early_touches})")
+                    return
+                self._remaining &= ~(1 << sensor_index)
+                self._score(sensor_index, timestamp_ns, window_ns)
+                return
+
+        # wrong led, or anything while nothing is lit
+        self.total_wrong_touches += 1
+        self.stats.add_wrong_touch(sensor_index)
+        self.difficulty.update(sensor_index)
+        self._round_wrong_touches += 1
+        print(f"[GAME] Wrong touch ({self.total_wrong_touches})")
+        self._blink_red(sensor_index)
+        if self.state == WAITING and step.ordered:
+            # a wrong touch ends a sequence
+            self.total_misses += len(step.targets) - self._expect
+            self._next_round()
+
+    def _target_visible(self, led_index):
+        """A frame with the target in it has been shown and the led shows green."""
+        return (self.led_strip.shown_seq >= self._target_seq and
+                self.led_strip.shown_color(led_index) == self.led_strip.green())
+
+    def _score(self, sensor_index, timestamp_ns, window_ns):
+        led_index = self.strip_led_pins[sensor_index]
+        # LED was pressed → measure reaction, before the led changes again
+        # and moves its shown_ns
+        self._measure_reaction(led_index, timestamp_ns, window_ns)
+        if self.step.ordered:
+            self.led_strip.set_pixel(led_index, self.led_strip.green(),
+                                     layer=OVERLAY_LAYER, duration=0.15)
+        else:
+            # Turn off LED
+            self.led_strip.turn_off_pixel(led_index)
 
-        # Start reaction game thread
-        self.game_thread = threading.Thread(target=self.reaction_game_loop)
-        self.game_thread.daemon = True
-        self.game_thread.start()
+        if self.reaction_time < 0:
+            # the touch can't come before the light, the timestamps are off
+            self.measurement_errors += 1
+            print(f"[GAME] LED {led_index} pressed {-self.reaction_time * 1000:.1f}ms before "
+                  f"it was lit, measurement error ({self.measurement_errors}), not counted")
+        else:
+            self._record_trial(sensor_index, led_index)
 
-    def reaction_game_loop(self):
-        while True:
-            #restart the game
-            self.running = True
-            self.total_reaction_time = 0.0
-            self.total_wrong_touches = 0
-
-            for _ in range(self.tries):
-                if not self.running:
-                    break
-
-                # Choose a random LED
-                self.current_led_index = random.choice(self.strip_led_pins)
-                print(f"[GAME] LED {self.current_led_index} ON")
-                self.led_strip.set_pixel(self.current_led_index, self.led_strip.green())
-                led_on_time = time.time()  # start time
-                self.led_pressed_event.clear()
-
-                # Wait until LED is pressed
-                # self.led_pressed_event.wait()  # blocked until touch callback sets it
-                while not self.led_pressed_event.is_set():
-                    if not self.running:
-                        break
-                    time.sleep(0.01)
-                
-                if not self.running:
-                    break
-
-
-                # LED was pressed → measure reaction
-                self.reaction_time = time.time() - led_on_time
-                print(f"[GAME] LED {self.current_led_index} pressed! Reaction: {self.reaction_time:.3f}s")
-
-                # add up the total time
-                self.total_reaction_time = self.reaction_time + self.total_reaction_time
-
-                # Turn off LED
-                self.led_strip.turn_off_pixel(self.current_led_index)
-
-                #sleep for between 0 to 3 seconds
-                time.sleep(random.uniform(0, 3))
-            
-            print(f"total time: {self.total_reaction_time}")
-            print(f"wrong touches: {self.total_wrong_touches} / {self.tries}")
-
-    def on_touch(self, sensor_index, pressed=True):
+        # the round is over once every target is hit
+        if self.step.ordered:
+            if self._expect < len(self.step.targets):
+                return
+        elif self._remaining:
+            return
+        self._next_round()
+
+    def _record_trial(self, sensor_index, led_index):
+        uncertainty = self.reaction_uncertainty
+        print(f"[GAME] LED {led_index} pressed! Reaction: {self.reaction_time:.3f}s "
+              f"±{'?' if uncertainty is None else f'{uncertainty * 1000:.2f}'}ms")
+
+        # add up the total time
+        self.total_reaction_time = self.reaction_time + self.total_reaction_time
+        self.stats.add_trial(sensor_index, self.reaction_time)
+        self.difficulty.update(sensor_index, self.reaction_time)
+        if self.store is not None:
+            self.store.add_trial(self._session, self.player, sensor_index, led_index,
+                                 self.reaction_time * 1e9,
+                                 -1 if uncertainty is None else uncertainty * 1e9,
+                                 self._round_wrong_touches)
+        self._round_wrong_touches = 0
+
+    def _timed_out(self):
+        self._timer = None
+        if self.state != WAITING:
+            return
+        missed = len(self.targets)
+        self.total_misses += missed
+        print(f"[GAME] Missed {missed}")
+        self._clear_targets()
+        self._next_round()
+
+    def _next_round(self):
+        self._cancel_timer()
+        self.state = SCORING
+        self.round += 1
+        self._arm()
+
+    def _time_up(self):
+        self._game_timer = None
+        if self.state in (IDLE, RESETTING, PAUSED):
+            return
+        print("[GAME] Time's up")
+        self._cancel_timer()
+        self._clear_targets()
+        self._end_game()
+
+    def _end_game(self):
+        self._cancel_game_timer()
+        hits = self.stats.session.count
+        print(f"total time: {self.total_reaction_time}")
+        print(f"wrong touches: {self.total_wrong_touches} / {self.round} rounds, "
+              f"{self.total_misses} missed, {self.total_early_touches} too early")
+        if hits:
+            self._print_stats()
+        self._end_session()
+        self._new_game()
+
+    def _end_session(self):
+        """Close the game's row in the store, also for a game cut short by a reset."""
+        if self.store is None or self._session is None:
+            return
+        hits = self.stats.session.count
+        self.store.end_session(self._session, hits, self.total_wrong_touches,
+                               int(self.total_reaction_time / hits * 1e9) if hits else None)
+        self._session = None
+
+    # Reaction timing
+    # the time the game reacts says little about the player: the led goes
+    # on at the next render and the touch is seen at the next scan. so the
+    # reaction is taken from the led's own shown_ns to the touch event's
+    # timestamp, both time.monotonic_ns(). each end is only known within a
+    # window, the midpoints are used and half of each window is reported as
+    # the uncertainty.
+    # with several targets lit, the second and later ones count from the
+    # previous hit, so each trial is the time that target itself took.
+    # an ordered step has nothing lit while it's repeated (only the hit
+    # flashes, which would move shown_ns), so it always counts from the
+    # previous hit, or from the end of the show for the first one.
+    # a touch with no timestamp (set_touch_callback, which only passes
+    # sensor and pressed) is timed when the game gets it, window_ns None:
+    # how late that is isn't known, so neither is the uncertainty (None).
+    def _measure_reaction(self, led_index, timestamp_ns, window_ns):
+        lit_ns = int(self.led_strip.shown_ns[led_index])
+        lit_window_ns = int(self.led_strip.shown_window_ns[led_index])
+        if self.step.ordered:
+            lit_ns = self._last_hit_ns
+            lit_window_ns = self._last_hit_window_ns
+        elif lit_ns < self._target_set_ns:
+            # the led was still green from the round before and never went
+            # off on the strip, it's been lit since the target was set
+            lit_ns = self._target_set_ns
+            lit_window_ns = 0
+        if self._last_hit_ns > lit_ns:
+            lit_ns = self._last_hit_ns
+            lit_window_ns = self._last_hit_window_ns
+        touch_ns = timestamp_ns - (window_ns or 0) // 2
+        self._last_hit_ns = touch_ns
+        self._last_hit_window_ns = window_ns
+        self.reaction_time = (touch_ns - lit_ns) / 1e9
+        if window_ns is None or lit_window_ns is None:
+            self.reaction_uncertainty = None
+        else:
+            self.reaction_uncertainty = (window_ns + lit_window_ns) / 2e9
+
+    def _print_stats(self):
+        session = self.stats.session.summary()
+        overall = self.stats.overall.summary()
+        print(f"[GAME] this game: mean {session['mean']:.3f}s ±{session['stdev']:.3f} "
+              f"p50 {session['p50']:.3f}s p90 {session['p90']:.3f}s")
+        print(f"[GAME] all games: {overall['trials']} trials, mean {overall['mean']:.3f}s "
+              f"p50 {overall['p50']:.3f}s p90 {overall['p90']:.3f}s trend {overall['trend']:.3f}s")
+        for i, sensor in self.stats.summary()["by_sensor"].items():
+            if sensor["trials"]:
+                print(f"[GAME]   sensor {i}: {sensor['trials']} trials, p50 {sensor['p50']:.3f}s "
+                      f"p90 {sensor['p90']:.3f}s, {sensor['wrong_touches']} wrong")
+        if self.difficulty.adaptive:
+            difficulty = self.difficulty.summary()
+            print(f"[GAME] difficulty {difficulty['level']:.2f}: {difficulty['targets']} target(s), "
+                  f"gap up to {difficulty['max_gap']:.2f}s")
+
+    def on_touch_event(self, event):
+        """Callback for MCP23017TouchLED.set_event_callback, keeps the touch timestamp."""
+        self.on_touch(event.sensor_index, event.pressed,
+                      event.timestamp_ns, event.window_ns)
+
+    # called from the touch driver's thread
+    def on_touch(self, sensor_index, pressed=True, timestamp_ns=None, window_ns=0):
         if sensor_index >= len(self.strip_led_pins):
             return
 
-        self.sensor_pressed[sensor_index] = pressed
-
-        # Check start/reset combo
-        self._check_start_reset()
+        # start/reset and the other gestures see presses and releases
+        self.gestures.on_touch(sensor_index, pressed, timestamp_ns)
 
         if not pressed:
             return  # only react on press for the game logic
 
-        now = time.time()
-        if now - self.last_touch[sensor_index] < self.debounce_ms / 1000:
+        if timestamp_ns is None:
+            # no timestamp from the driver, see _measure_reaction
+            timestamp_ns = time.monotonic_ns()
+            window_ns = None
+        if timestamp_ns - self.last_touch[sensor_index] < self.debounce_ms * 1_000_000:
             return
 
-        self.last_touch[sensor_index] = now
-        led_index = self.strip_led_pins[sensor_index]
-
-        if led_index == self.current_led_index:
-            #unblocks the while not self.led_pressed_event.is_set()
-            self.led_pressed_event.set()
-        else:
-            self.total_wrong_touches += 1
-            print(f"[GAME] Wrong touch ({self.total_wrong_touches})")
-            threading.Thread(target=self._blink_red, args=(sensor_index,), daemon=True).start()
+        self.last_touch[sensor_index] = timestamp_ns
+        self.scheduler.call_soon(self._on_press, sensor_index, timestamp_ns, window_ns)
    
     def _blink_red(self, sensor_index, duration=0.2):
-        """Blink the LED corresponding to sensor_index red briefly without affecting others."""
-        led_index = self.strip_led_pins[sensor_index]
+        """Blink the LED corresponding to sensor_index red briefly without affecting others.
 
-        # Save current color
-        current_state = self.led_strip.state[led_index]
-        # Set to red
-        self.led_strip.set_pixel(led_index, self.led_strip.red())
-        time.sleep(duration)
-
-        # Restore previous state
-        if current_state:
-            # LED was on, restore green (active LED)
-            if led_index == self.current_led_index:
-                self.led_strip.set_pixel(led_index, self.led_strip.green())
+        The red goes on the overlay layer with an expiry, so the render loop
+        drops it after duration and whatever the game had there shows again.
+        Repeated wrong touches just push the expiry out, no thread per blink.
+        """
+        led_index = self.strip_led_pins[sensor_index]
+        self.led_strip.set_pixel(led_index, self.led_strip.red(),
+                                 layer=OVERLAY_LAYER, duration=duration)
+
+    def set_difficulty(self, difficulty):
+        """Swap the difficulty, from the next game on. 'adaptive' builds an
+        AdaptiveDifficulty on this consumer's stats."""
+        if difficulty == "adaptive":
+            difficulty = AdaptiveDifficulty(self.stats, len(self.strip_led_pins),
+                                            max_gap=self.max_gap)
+        elif difficulty == "fixed":
+            difficulty = FixedDifficulty(len(self.strip_led_pins), self.max_gap)
+        self.difficulty = difficulty
+
+    def set_mode(self, mode, tries=None):
+        """Play mode (a GameMode or a name in game_modes.MODES) from the next game on.
+
+        A mode given by name that counts rounds plays tries of them, the
+        consumer's tries if not given.
+        """
+        if isinstance(mode, str):
+            mode_class = MODES[mode]
+            if mode_class.tries is not None:
+                mode = mode_class(tries=self._tries if tries is None else tries)
             else:
-                # If it was on for some other reason, just leave red off
-                self.led_strip.turn_off_pixel(led_index)
-        else:
-            self.led_strip.turn_off_pixel(led_index)
-            
-
-    def _check_start_reset(self):
-        s1, s2 = self.start_combo
-        now = time.time()
-
-        if self.sensor_pressed[s1] and self.sensor_pressed[s2]:
-            if self.start_press_time is None:
-                self.start_press_time = now
-            elif now - self.start_press_time >= self.start_hold_time:
-                self._reset_game()
-                self.start_press_time = None
-        else:
-            self.start_press_time = None
+                mode = mode_class()
+        self.mode = mode
+        self.tries = mode.tries
+
+    def set_player(self, player):
+        """Who the next game is recorded for."""
+        self.player = player
+
+    def add_gesture(self, gesture, callback, *args):
+        """Run callback(*args) on the scheduler thread when gesture is made, see gestures.py."""
+        return self.gestures.add(gesture, callback, *args)
 
     def _reset_game(self):
         print("\n[GAME] RESET triggered!")
-        self.running = False
+        self._cancel_timer()
+        self._cancel_game_timer()
+        self._end_session()
+        self.state = RESETTING
+        self._remaining = 0
+        self.current_led_index = None
 
-        self.total_reaction_time = 0.0
-        self.total_wrong_touches = 0
-        self.reaction_time = None
+        # clear the game and blink blue over everything for 0.2 sec
+        with self.led_strip.frame():
+            self.led_strip.turn_all_off()
+            self.led_strip.clear_layer(OVERLAY_LAYER)
+            self.led_strip.fill(self.led_strip.blue(), layer=SYSTEM_LAYER, duration=self.reset_flash)
 
-        self.led_pressed_event.set()  # unblock game loop if waiting
-
-        self.led_strip.turn_all(self.led_strip.blue())
-        time.sleep(0.2)
-
-        self.led_strip.turn_all_off()
-
-    #not sure if is ideal but it keeps checking every 50ms if two buttons are pressed
-    #pressed states are stored in sensor_pressed[]
-    # eg. 
-    # use touches 1
-    # on_touch(1,True)
-    # sensor_pressed[1]=True
-    # _check_start_reset() #do nothing. no reset.
-    # start_press_time = None
-
-    # user touches 0
-    # on_touch(0, True)
-    # sensor_pressed[0] = True
-    # _check_start_reset()
-    # start_press_time = now and 
-
-    #user presses both for 1 sec
-    #combo_thread checks every 50ms
-    #both pressed ?
-    #if now - start_press_time >= 1
-    #  reset_game
-    def _combo_monitor(self):
-        while True:
-            self._check_start_reset()
-            time.sleep(0.05)  # 50 ms resolution
+        # new game once the flash is over
+        self._timer = self.scheduler.call_later(self.reset_flash, self._new_game)
 
 def testCallback():
     #PA
@@ -229,13 +860,27 @@ def testCallback():
         sensor_pins=sensor_pins,
         led_pins=[1]
     )
+    # presses and releases are debounced in the driver, so the reset combo
+    # doesn't see contact chatter
+    touch_led.set_debounce(LOCKOUT, lockout_ms=30)
+
+    # one thread for every timed thing on the station
+    scheduler = Scheduler()
+    scheduler.start()
 
     led_strip = LedStrip()
+    led_strip.start_render_loop(max_fps=60, scheduler=scheduler)
     strip_led_pins = [15, 19, 23, 27]
     tries = 3
 
-    consumer = TouchConsumer2(led_strip, strip_led_pins, tries=10)
-    touch_led.set_touch_callback(consumer.on_touch)
+    # results go to reaction.db, see session_store.py
+    store = SessionStore("reaction.db")
+    # DIFFICULTY=adaptive follows the player, see difficulty.py
+    # GAME_MODE=sequence, whack or rush, see game_modes.py
+    consumer = TouchConsumer2(led_strip, strip_led_pins, tries=10, scheduler=scheduler,
+                              store=store, difficulty=os.environ.get("DIFFICULTY"),
+                              mode=os.environ.get("GAME_MODE"))
+    touch_led.set_event_callback(consumer.on_touch_event)
 
     touch_led.start()
 
@@ -244,6 +889,14 @@ def testCallback():
             time.sleep(1)
     except KeyboardInterrupt:
         print("Exiting...")
+        led_strip.stop_render_loop()
+        print(f"frames shown: {led_strip.frames_shown} skipped: {led_strip.frames_skipped}")
+        print(f"debounce: {touch_led.debounce_stats()}")
+        scheduler.stop()
+        # the scheduler thread is gone, so the game in progress can be
+        # ended from here. stop() would only queue it on the scheduler
+        consumer._end_session()
+        store.close()
         touch_led.cleanup()
 
 
@@ -1,4 +1,9 @@
-from smbus2 import SMBus
+from i2c_bus import SMBus
+from touch_events import TouchEventRing
+from debounce import Debouncer, LOCKOUT, INTEGRATOR, HYSTERESIS
+from touch_record import TouchRecorder
+from bus_stats import InstrumentedSMBus, TimedLock
+import os
 import threading
 import time
 
@@ -30,153 +35,818 @@ import time
 # LED -> PA1 
 # GND -> GND
 
+# more chips: set A2 A1 A0 for addresses 0x20-0x27, SDA/SCL shared,
+# INTA of every chip wired together to GPIO17 (open drain, see #interrupt mode)
+
 
 #todo isolate LED from this class because it's only used for debugging atm
 
 
-class MCP23017TouchLED:
-    def __init__(self, i2c_addr=0x27, bus_id=1, sensor_pins=None, led_pins=None):
+#pins
+# pins are numbered across all chips, 16 per chip in the order of i2c_addr:
+# chip 0 PA0-PA7 = 0-7, PB0-PB7 = 8-15, chip 1 PA0 = 16 and so on.
+# with one chip at 0x27 that's the same numbering as before (PA2 = 2).
+#
+# touch_led = MCP23017TouchLED(i2c_addr=[0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27],
+#                              sensor_pins=range(128), led_pins=[])
+#
+# a scan reads GPIOA+GPIOB of every chip with one block read, so 128 sensors
+# cost 8 transactions. IOCON is 0x00 (BANK=0, sequential addressing) so the
+# address pointer runs GPIOA -> GPIOB and INTCAPA -> ... -> GPIOB.
+
+
+#interrupt mode
+# pass int_source (see gpio_edge.py) and the chips raise INT whenever a
+# sensor pin changes. IOCON.MIRROR ties port B to INTA and IOCON.ODR makes it
+# open drain, so the INTA pins of all chips can share one gpio. the bus
+# thread sleeps until that edge and then reads INTCAPA..GPIOB in one block
+# per chip: the ports at the moment of the change (this also releases INT)
+# and the ports now. nothing is read while nobody touches anything except a
+# scan every int_fallback_s in case an edge was missed.
+#
+# touch_led = MCP23017TouchLED(sensor_pins=[2, 3, 4, 5], led_pins=[1],
+#                              int_source=RPiGpioEdgeSource(pin=17))
+
+
+#events
+# the bus thread never calls user code. every edge goes into a bounded ring
+# as TouchEvent(sensor_index, pressed, timestamp_ns, raw, window_ns) and a
+# dispatcher thread hands them to the callbacks, so a slow callback can't
+# hold up the next scan. timestamp_ns is time.monotonic_ns() of the sample
+# (or of the interrupt edge for the captured one), raw is the whole scan
+# bitmask and window_ns how far before timestamp_ns the touch could have
+# happened: the time since the previous sample when polling, the edge
+# source latency with interrupts.
+# without a callback read them yourself:
+#
+# for event in touch_led.events():
+#     print(event)
+
+
+#debounce
+# every scan goes through a Debouncer (see debounce.py) before edges are
+# looked for, so touched_mask and the events only ever see debounced
+# changes, presses and releases alike. nothing is debounced until
+# set_debounce() is called. while a pin is still settling the bus thread
+# reads it again when the debouncer asks, so in interrupt mode an
+# integrator gets its samples without waiting for the fallback scan.
+#
+# touch_led.set_debounce(LOCKOUT, lockout_ms=40)
+# touch_led.set_debounce(HYSTERESIS, sensors=[0, 1], press_samples=2, release_samples=4)
+# print(touch_led.debounce_stats())
+
+
+#recording
+# record(path) writes every raw sample the bus thread reads, before
+# debouncing, see touch_record.py. to replay, start(scan=False) a driver so
+# no bus thread reads the chips and feed it with touch_record.play(), which
+# calls inject_sample(). only one thread may feed samples at a time.
+
+
+#bus thread
+# one thread owns the bus and nothing else calls smbus after start().
+# work is picked by priority, touch reads first, so a touch never waits
+# behind an LED write:
+#   touch   a scan (every scan_interval, or on an interrupt edge)
+#   led     one OLAT write per chip with whatever led_on says when it runs,
+#           so any number of set_led() calls in between go out as one write
+#   config  write_register()/update_register() calls, A/B pairs written in
+#           one transaction
+# a failed bus call (an OSError, EIO or a NACK on a long run) doesn't stop
+# the thread: it's counted in bus_errors, led and config work is put back
+# and the thread retries after a pause that doubles up to 1 s. callbacks
+# that run on the thread (set_led, write_register) can't kill it either.
+TOUCH = 0
+LED = 1
+CONFIG = 2
+REQUEST_CLASSES = ("touch", "led", "config")
+
+
+# MCP23017 registers (BANK=0 addresses, port B is the A address + 1)
+IODIRA   = 0x00
+IPOLA    = 0x02
+GPINTENA = 0x04
+DEFVALA  = 0x06
+INTCONA  = 0x08
+IOCON    = 0x0A
+GPPUA    = 0x0C
+INTFA    = 0x0E
+INTCAPA  = 0x10
+GPIOA    = 0x12
+OLATA    = 0x14
+REGISTER_COUNT = 0x16
+
+# for the bus stats, 0x00 -> IODIRA, 0x01 -> IODIRB ...
+REGISTER_NAMES = {}
+for _name, _addr in (("IODIR", IODIRA), ("IPOL", IPOLA), ("GPINTEN", GPINTENA),
+                     ("DEFVAL", DEFVALA), ("INTCON", INTCONA), ("GPPU", GPPUA),
+                     ("INTF", INTFA), ("INTCAP", INTCAPA), ("GPIO", GPIOA), ("OLAT", OLATA)):
+    REGISTER_NAMES[_addr] = _name + "A"
+    REGISTER_NAMES[_addr + 1] = _name + "B"
+REGISTER_NAMES[IOCON] = REGISTER_NAMES[IOCON + 1] = "IOCON"
+
+IOCON_MIRROR = 0x40
+IOCON_SEQOP  = 0x20
+IOCON_ODR    = 0x04
+
+#shadow registers
+# every writable register has a copy in MCP23017Chip.shadow, loaded from the
+# chip once at startup. writes that would not change anything are skipped and
+# read-modify-write uses the copy instead of reading the bus. on a warm
+# restart most of configure() turns into no writes at all.
+WRITABLE_REGISTERS = (0x00, 0x01,   # IODIR
+                      0x02, 0x03,   # IPOL
+                      0x04, 0x05,   # GPINTEN
+                      0x06, 0x07,   # DEFVAL
+                      0x08, 0x09,   # INTCON
+                      0x0A, 0x0B,   # IOCON
+                      0x0C, 0x0D,   # GPPU
+                      0x14, 0x15)   # OLAT
+
+
+class MCP23017Chip:
+    """One expander. Bus thread only once the driver has started."""
+
+    def __init__(self, bus, addr):
+        self.bus = bus
+        self.addr = addr
+        # register -> value the chip holds, see load_shadow
+        self.shadow = {}
+        self.writes_sent = 0
+        self.writes_skipped = 0
+
+    def load_shadow(self):
+        """Read every register in one block read to seed the shadow.
+
+        That needs sequential addressing (IOCON.SEQOP=0). A chip left in byte
+        mode by an older version of this driver is switched over first.
+        """
+        iocon = self.bus.read_byte_data(self.addr, IOCON)
+        if iocon & IOCON_SEQOP:
+            iocon &= ~IOCON_SEQOP
+            self.bus.write_byte_data(self.addr, IOCON, iocon)
+        values = self.bus.read_i2c_block_data(self.addr, 0x00, REGISTER_COUNT)
+        self.shadow = {reg: values[reg] for reg in WRITABLE_REGISTERS}
+        # IOCON is one register at two addresses
+        self.shadow[IOCON] = self.shadow[IOCON + 1] = iocon
+
+    def configure(self, iodir, gppu, gpinten=None, iocon=0x00):
+        """16 bit values, port A in the low byte. gpinten=None leaves interrupts off."""
+        self.load_shadow()
+        self.write_reg(IOCON, iocon)
+        self.write16(IODIRA, iodir)
+        self.write16(GPPUA, gppu)
+        #turn off
+        self.write16(OLATA, 0x0000)
+        if gpinten is not None:
+            # interrupt on change against the previous value
+            self.write16(INTCONA, 0x0000)
+            self.write16(DEFVALA, 0x0000)
+            self.write16(GPINTENA, gpinten)
+            # clear anything already pending so INT starts released
+            self.read_captured()
+
+    def write_reg(self, register, value):
+        """Write a register unless the chip already holds value."""
+        value &= 0xFF
+        if self.shadow.get(register) == value:
+            self.writes_skipped += 1
+            return
+        self.bus.write_byte_data(self.addr, register, value)
+        self.set_shadow(register, value)
+        self.writes_sent += 1
+
+    def write16(self, register_a, value):
+        """Write an A/B register pair, in one block write if both bytes change."""
+        low, high = value & 0xFF, (value >> 8) & 0xFF
+        if self.shadow.get(register_a) != low and self.shadow.get(register_a + 1) != high:
+            self.bus.write_i2c_block_data(self.addr, register_a, [low, high])
+            self.set_shadow(register_a, low)
+            self.set_shadow(register_a + 1, high)
+            self.writes_sent += 2
+        else:
+            self.write_reg(register_a, low)
+            self.write_reg(register_a + 1, high)
+
+    def set_shadow(self, register, value):
+        self.shadow[register] = value
+        if register in (IOCON, IOCON + 1):
+            self.shadow[IOCON] = self.shadow[IOCON + 1] = value
+
+    def read_ports(self):
+        """GPIOA | GPIOB << 8 in one transaction."""
+        low, high = self.bus.read_i2c_block_data(self.addr, GPIOA, 2)
+        return low | (high << 8)
+
+    def read_captured(self):
+        """(INTCAP, GPIO) as 16 bit values in one transaction. Releases INT."""
+        cap_a, cap_b, gpio_a, gpio_b = self.bus.read_i2c_block_data(self.addr, INTCAPA, 4)
+        return cap_a | (cap_b << 8), gpio_a | (gpio_b << 8)
+
+
+class MCP23017Group:
+    """Any number of chips on one bus, scanned as one big bitmask."""
+
+    def __init__(self, bus, addrs):
+        self.bus = bus
+        self.chips = [MCP23017Chip(bus, addr) for addr in addrs]
+        self.scans = 0
+        self.scan_ns = 0
+        self._started_ns = time.monotonic_ns()
+
+    def configure(self, iodir, gppu, gpinten=None):
+        """Bitmasks across all chips, 16 bits per chip."""
+        iocon = 0x00 if gpinten is None else IOCON_MIRROR | IOCON_ODR
+        for i, chip in enumerate(self.chips):
+            shift = i * 16
+            chip.configure((iodir >> shift) & 0xFFFF, (gppu >> shift) & 0xFFFF,
+                           None if gpinten is None else (gpinten >> shift) & 0xFFFF,
+                           iocon)
+
+    def scan(self):
+        """Every pin of every chip, one transaction per chip."""
+        start = time.monotonic_ns()
+        val = 0
+        for i, chip in enumerate(self.chips):
+            val |= chip.read_ports() << (i * 16)
+        self._count_scan(start)
+        return val
+
+    def scan_captured(self):
+        """(captured, current) for all chips after an interrupt."""
+        start = time.monotonic_ns()
+        captured = current = 0
+        for i, chip in enumerate(self.chips):
+            cap, now = chip.read_captured()
+            captured |= cap << (i * 16)
+            current |= now << (i * 16)
+        self._count_scan(start)
+        return captured, current
+
+    def write_outputs(self, olat):
+        """OLAT bitmask across all chips. Chips whose outputs didn't change cost nothing."""
+        for i, chip in enumerate(self.chips):
+            chip.write16(OLATA, (olat >> (i * 16)) & 0xFFFF)
+
+    def chip(self, addr):
+        for chip in self.chips:
+            if chip.addr == addr:
+                return chip
+        raise ValueError(f"no MCP23017 at {addr:#x}")
+
+    def _count_scan(self, start_ns):
+        self.scans += 1
+        self.scan_ns += time.monotonic_ns() - start_ns
+
+    def scan_stats(self):
+        elapsed = max(1, time.monotonic_ns() - self._started_ns) / 1e9
+        return {
+            "chips": len(self.chips),
+            "scans": self.scans,
+            "scans_per_s": self.scans / elapsed,
+            "mean_scan_ms": self.scan_ns / self.scans / 1e6 if self.scans else 0.0,
+        }
+
+    def reset_scan_stats(self):
+        self.scans = 0
+        self.scan_ns = 0
+        self._started_ns = time.monotonic_ns()
+
+    @property
+    def writes_sent(self):
+        return sum(chip.writes_sent for chip in self.chips)
+
+    @property
+    def writes_skipped(self):
+        return sum(chip.writes_skipped for chip in self.chips)
 
-        # MCP23017 registers
-        self.ADDR   = i2c_addr
-        self.IODIRA = 0x00
-        self.GPPUA  = 0x0C
-        self.GPIOA  = 0x12
-        self.OLATA  = 0x14
-        self.IOCON  = 0x0A
 
-        self.sensor_pins = sensor_pins
-        self.led_pins = led_pins
+class MCP23017TouchLED:
+    def __init__(self, i2c_addr=0x27, bus_id=1, sensor_pins=None, led_pins=None,
+                 int_source=None, scan_interval=0.05, int_fallback_s=1.0,
+                 event_capacity=1024, instrument=None):
+
+        # one address or a list of them, see #pins
+        if isinstance(i2c_addr, int):
+            i2c_addr = [i2c_addr]
+        self.ADDR = i2c_addr[0]
+
+        # polling period, and how often interrupt mode reads anyway
+        self.scan_interval = scan_interval
+        self.int_source = int_source
+        self.int_fallback_s = int_fallback_s
+        # monotonic_ns of the last interrupt edge
+        self.last_edge_ns = None
+        # monotonic_ns of the last scan, see #events
+        self._last_scan_ns = None
+
+        self.sensor_pins = list(sensor_pins)
+        self.led_pins = list(led_pins)
 
         self.sensor_masks = []
-        for pin in sensor_pins:
+        for pin in self.sensor_pins:
             self.sensor_masks.append(1 << pin)
 
         self.led_masks = []
-        for pin in led_pins:
+        for pin in self.led_pins:
             self.led_masks.append(1 << pin)
 
-        self.touched = []
-        for _ in range(len(sensor_pins)):
-            self.touched.append(False)
-
+        # sensor state is one int across all chips, bit = pin. edges are
+        # found with xor/and over the whole thing instead of per sensor
+        self.sensor_mask_all = 0
+        for mask in self.sensor_masks:
+            self.sensor_mask_all |= mask
+        self._pin_to_sensor = {pin: i for i, pin in enumerate(self.sensor_pins)}
+        self.touched_mask = 0
+        self.debouncer = Debouncer()
+        # TouchRecorder while recording, see #recording
+        self.recorder = None
 
         self.led_on = []
-        for _ in range(len(led_pins)):
+        for _ in range(len(self.led_pins)):
             self.led_on.append(False)
 
-        self._lock = threading.Lock()
+        # instrument: count every bus call and time the lock, see bus_stats.py
+        if instrument is None:
+            instrument = os.environ.get("I2C_STATS") == "1"
+        self.instrument = instrument
+
+        # protects the state above and the request slots below. the bus
+        # itself is only used by the bus thread so it needs no lock
+        self._lock = TimedLock() if instrument else threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+        # pending work. touch and led are single slots holding the time
+        # they were first asked for, config is a fifo of
+        # (addr, register, mask, value, requested_ns, done_callback)
+        self._touch_requested_ns = None
+        self._int_fired = False
+        # extra read the debouncer asked for, see #debounce
+        self._resample_ns = None
+        self._led_requested_ns = None
+        self._led_callbacks = []
+        self._config_queue = []
+        self._running = False
+        # failed bus calls and callbacks that raised, see #bus thread
+        self.bus_errors = 0
+        self.callback_errors = 0
+
+        # queue latency per request class: [count, total_ns, max_ns]
+        self._queue_latency = [[0, 0, 0] for _ in REQUEST_CLASSES]
+
+        # debug LED blink, see _control_step
+        self.start_time = None
+        self._control_due_ns = None
 
         # Initialize I2C
         self.bus = SMBus(bus_id)
+        if instrument:
+            self.bus = InstrumentedSMBus(self.bus, REGISTER_NAMES)
+        self.group = MCP23017Group(self.bus, i2c_addr)
         self._configure_device()
 
         # add callbacks
         self._touch_callback = None
-        self._prev_touched = [False] * len(sensor_pins)
+        self._event_callback = None
+        self.ring = TouchEventRing(event_capacity)
 
         # Threads
-        self.sensor_thread = threading.Thread(target=self._touch_sensor_thread, daemon=True)
-        self.led_thread = threading.Thread(target=self._led_thread, daemon=True)
-        self.control_thread = threading.Thread(target=self._control_thread, daemon=True)
+        self.bus_thread = threading.Thread(target=self._bus_thread, daemon=True)
+        self.dispatch_thread = None
 
-        print("Touch sensor on PA2 ready")
+        print(f"Touch sensors on {len(self.group.chips)} MCP23017 ready")
 
 
     def _configure_device(self):
-        """Initial configuration of MCP23017."""
+        """Initial configuration of the MCP23017s. Runs before the bus thread starts."""
+        #set all LED pins to output (0)
+        iodir = (1 << (16 * len(self.group.chips))) - 1
+        for mask in self.led_masks:
+            iodir &= ~mask
+
+        #enable pull up for touch sensors
+        all_mask = self.sensor_mask_all
+
+        gpinten = all_mask if self.int_source is not None else None
+        self.group.configure(iodir, all_mask, gpinten)
+
+    @property
+    def touched(self):
+        """Per sensor bools, built from touched_mask."""
+        val = self.touched_mask
+        return [(val & mask) != 0 for mask in self.sensor_masks]
+
+    @property
+    def writes_sent(self):
+        return self.group.writes_sent
+
+    @property
+    def writes_skipped(self):
+        return self.group.writes_skipped
+
+    def scan_stats(self):
+        return self.group.scan_stats()
+
+    def set_debounce(self, strategy, sensors=None, **params):
+        """Debounce sensors (indices, default all) with LOCKOUT, INTEGRATOR or HYSTERESIS.
+
+        params go to Debouncer.add: lockout_ms, samples, press_samples, release_samples.
+        strategy None turns debouncing off for those sensors.
+        """
+        if sensors is None:
+            sensors = range(len(self.sensor_pins))
+        mask = 0
+        for i in sensors:
+            mask |= self.sensor_masks[i]
         with self._lock:
-            # disable sequential addressing
-            self.bus.write_byte_data(self.ADDR, self.IOCON, 0x20)       
-
-            #set all LED pins to output (0)
-            iodir = 0xFF
-            for pin in self.led_pins:
-                iodir &= ~(1 << pin)
-            self.bus.write_byte_data(self.ADDR, self.IODIRA, iodir)
-            
-            #enable pull up for touch sensors
-            all_mask = 0x00
-            for mask in self.sensor_masks:
-                all_mask = all_mask | mask
-            self.bus.write_byte_data(self.ADDR, self.GPPUA, all_mask)
-
-            #turn off
-            self.bus.write_byte_data(self.ADDR, self.OLATA, 0x00)
-
-    def start(self):
-        """Start all threads."""
-        self.sensor_thread.start()
-        self.led_thread.start()
-        self.control_thread.start()
-
-    def _touch_sensor_thread(self):
-        """Continuously read touch sensor state and emit events."""
-        while True:
-            callbacks_to_call = []
-
-            with self._lock:
-                val = self.bus.read_byte_data(self.ADDR, self.GPIOA)
-
-                for i, mask in enumerate(self.sensor_masks):
-                    current = (val & mask) != 0
-                    previous = self._prev_touched[i]
-
-                    # Rising edge: not touched -> touched
-                    if current and not previous:
-                        callbacks_to_call.append((i, True))
-
-                    # Falling edge: touched -> not touched
-                    elif not current and previous:
-                        callbacks_to_call.append((i, False))
+            if strategy is None:
+                self.debouncer.remove(mask)
+            else:
+                self.debouncer.add(mask, strategy, **params)
 
-                    self.touched[i] = current
-                    self._prev_touched[i] = current
-
-            # Call callbacks OUTSIDE the lock
-            if self._touch_callback:
-                for sensor_index, pressed in callbacks_to_call:
-                    self._touch_callback(sensor_index, pressed)
-
-            time.sleep(0.05)
+    def debounce_stats(self):
+        """Per sensor {"accepted", "rejected", "shortest_press_ms"}."""
+        with self._lock:
+            by_bit = self.debouncer.stats()
+        stats = []
+        for mask in self.sensor_masks:
+            accepted, rejected, shortest_ns = by_bit.get(mask, (0, 0, None))
+            stats.append({"accepted": accepted, "rejected": rejected,
+                          "shortest_press_ms": None if shortest_ns is None else shortest_ns / 1e6})
+        return stats
+
+    def bus_stats(self):
+        """Per op/register bus stats and the lock wait times. None unless instrumented."""
+        if not self.instrument:
+            return None
+        return {"ops": self.bus.stats(), "totals": self.bus.totals(),
+                "lock_wait": self._lock.summary()}
+
+    def dump_bus_stats(self):
+        if self.instrument:
+            self.bus.dump({"lock": self._lock.summary()})
+
+    def start(self, scan=True):
+        """Start the bus thread, and the dispatcher if a callback is set.
+
+        scan=False leaves the bus thread off, for feeding inject_sample().
+        """
+        with self._lock:
+            self._running = True
+        if scan:
+            if self.int_source is not None:
+                self.int_source.set_callback(self._on_int_edge)
+            self.bus_thread.start()
+        if self._touch_callback or self._event_callback:
+            self._start_dispatcher()
+
+    def record(self, path):
+        """Write every raw sample to path from now on. Returns the TouchRecorder."""
+        recorder = TouchRecorder(path, chips=len(self.group.chips))
+        with self._lock:
+            previous, self.recorder = self.recorder, recorder
+        if previous is not None:
+            previous.close()
+        return recorder
 
+    def stop_recording(self):
+        with self._lock:
+            recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+        return recorder
+
+    def inject_sample(self, val, timestamp_ns=None, window_ns=0):
+        """Process val as if the bus thread had just read it. Returns the number of events."""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with self._lock:
+            events = self._process_sample(val, timestamp_ns, window_ns)
+        for event in events:
+            self.ring.push(*event)
+        return len(events)
+
+    def events(self, timeout=None):
+        """Blocking iterator over TouchEvents. Only when no callback is set."""
+        return self.ring.events(timeout)
+
+    def event_stats(self):
+        return {"pushed": self.ring.pushed, "queued": len(self.ring),
+                "overflows": self.ring.overflows}
+
+    def _start_dispatcher(self):
+        if self.dispatch_thread is None and self._running:
+            self.dispatch_thread = threading.Thread(target=self._dispatch_thread, daemon=True)
+            self.dispatch_thread.start()
+
+    def _dispatch_thread(self):
+        """Hand events from the ring to the callbacks, off the bus thread."""
+        for event in self.ring.events():
+            try:
+                if self._event_callback:
+                    self._event_callback(event)
+                if self._touch_callback:
+                    self._touch_callback(event.sensor_index, event.pressed)
+            except Exception as e:
+                print(f"touch callback failed: {e}")
+
+    # Requests from other threads
+    def set_led(self, index, on=True, callback=None):
+        """callback() runs once the chip outputs it (right away if nothing changes)."""
+        with self._lock:
+            if self.led_on[index] == on:
+                done_now = True
+            else:
+                done_now = False
+                self.led_on[index] = on
+                self._request_led()
+                if callback:
+                    self._led_callbacks.append(callback)
+        if done_now and callback:
+            callback()
+
+    def write_register(self, register, value, callback=None, addr=None):
+        """Queue a register write. callback() runs on the bus thread once it's written."""
+        self.update_register(register, 0xFF, value, callback, addr)
+
+    def update_register(self, register, mask, value, callback=None, addr=None):
+        """Queue a read-modify-write of the bits in mask. Uses the shadow, no bus read."""
+        if addr is None:
+            addr = self.ADDR
+        with self._lock:
+            self._config_queue.append((addr, register, mask, value, time.monotonic_ns(), callback))
+            self._wakeup.notify()
 
-    def _led_thread(self):
-        """Simplified LED thread: just sets LED according to led_on state."""
-        while True:
-            with self._lock:
-                olata_val = 0x00
-                for i, led_state in enumerate(self.led_on):
-                    if led_state:
-                        olata_val |= self.led_masks[i]
-                self.bus.write_byte_data(self.ADDR, self.OLATA, olata_val)
-            time.sleep(0.05)
-
-    def _control_thread(self):
+    def queue_stats(self):
+        """Time requests waited before the bus thread got to them, per class."""
+        with self._lock:
+            stats = {}
+            for name, (count, total_ns, max_ns) in zip(REQUEST_CLASSES, self._queue_latency):
+                stats[name] = {
+                    "count": count,
+                    "mean_ms": total_ns / count / 1e6 if count else 0.0,
+                    "max_ms": max_ns / 1e6,
+                }
+            return stats
+
+    def _request_led(self):
+        """Called with _lock held."""
+        if self._led_requested_ns is None:
+            self._led_requested_ns = time.monotonic_ns()
+            self._wakeup.notify()
+
+    def _on_int_edge(self, timestamp_ns):
+        with self._lock:
+            self.last_edge_ns = timestamp_ns
+            self._int_fired = True
+            if self._touch_requested_ns is None:
+                self._touch_requested_ns = timestamp_ns
+            self._wakeup.notify()
+
+    # Bus thread
+    def _bus_thread(self):
+        next_scan_ns = time.monotonic_ns()
+        failures = 0
         while True:
             with self._lock:
-                if not self.led_on[0]:
-                    self.led_on[0] = True
-                    self.start_time = time.time()
-                    #print("LED ON")
+                job, requested_ns = self._next_job(next_scan_ns)
+                if job is None:
+                    break
+                if job == TOUCH:
+                    int_fired = self._int_fired
+                    self._int_fired = False
+                    self._touch_requested_ns = None
+                elif job == LED:
+                    olat = self._olat_value()
+                    self._led_requested_ns = None
+                    led_callbacks = self._led_callbacks
+                    self._led_callbacks = []
+                else:
+                    writes = self._config_queue
+                    self._config_queue = []
+                self._record_latency(job, requested_ns)
+
+            try:
+                if job == TOUCH:
+                    if self.int_source is None:
+                        # schedule from the deadline so the scan rate doesn't drift
+                        next_scan_ns = max(next_scan_ns + int(self.scan_interval * 1e9),
+                                           time.monotonic_ns())
+                    else:
+                        next_scan_ns = time.monotonic_ns() + int(self.int_fallback_s * 1e9)
+                    self._run_touch_read(int_fired)
+                elif job == LED:
+                    self.group.write_outputs(olat)
+                    self._run_callbacks(led_callbacks)
+                else:
+                    self._run_config_writes(writes)
+            except OSError as e:
+                with self._lock:
+                    self.bus_errors += 1
+                    # a scan just runs again, led and config work is redone
+                    if job == LED:
+                        self._led_callbacks[:0] = led_callbacks
+                        self._request_led()
+                    elif job == CONFIG:
+                        self._config_queue[:0] = writes
+                failures += 1
+                backoff = min(1.0, 0.005 * 2 ** min(failures, 8))
+                print(f"[I2C] {REQUEST_CLASSES[job]} failed ({self.bus_errors} errors): {e}, "
+                      f"retrying in {backoff * 1000:.0f} ms")
+                time.sleep(backoff)
+                continue
+            except Exception as e:
+                # a bug, not the bus. don't take every touch and led down with it
+                self.callback_errors += 1
+                print(f"[I2C] {REQUEST_CLASSES[job]} job raised {e!r}")
+            failures = 0
+
+    def _run_callbacks(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.callback_errors += 1
+                print(f"[I2C] callback {callback!r} raised {e!r}")
+
+    def _next_job(self, next_scan_ns):
+        """Called with _lock held. Sleep until there is work, return (class, requested_ns)."""
+        while self._running:
+            now = time.monotonic_ns()
+            if now >= next_scan_ns and self._touch_requested_ns is None:
+                # poll tick, or the interrupt mode fallback read
+                self._touch_requested_ns = next_scan_ns
+            if self._resample_ns is not None and now >= self._resample_ns:
+                if self._touch_requested_ns is None:
+                    self._touch_requested_ns = self._resample_ns
+                self._resample_ns = None
+            if self._control_due_ns is not None and now >= self._control_due_ns:
+                self._control_due_ns = None
+                self._control_step()
+
+            if self._touch_requested_ns is not None:
+                return TOUCH, self._touch_requested_ns
+            if self._led_requested_ns is not None:
+                return LED, self._led_requested_ns
+            if self._config_queue:
+                return CONFIG, self._config_queue[0][4]
+
+            deadline = next_scan_ns
+            if self._resample_ns is not None:
+                deadline = min(deadline, self._resample_ns)
+            if self._control_due_ns is not None:
+                deadline = min(deadline, self._control_due_ns)
+            self._wakeup.wait(max(0, deadline - now) / 1e9)
+        return None, None
+
+    def _record_latency(self, job, requested_ns):
+        """Called with _lock held."""
+        waited = max(0, time.monotonic_ns() - requested_ns)
+        stats = self._queue_latency[job]
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+
+    def _run_touch_read(self, int_fired):
+        scan_ns = time.monotonic_ns()
+        # anything new in this sample changed after the previous one
+        window_ns = scan_ns - self._last_scan_ns if self._last_scan_ns else 0
+        self._last_scan_ns = scan_ns
+        if int_fired or (self.int_source is not None and self.int_source.asserted()):
+            # the ports when the change happened, then the ports now,
+            # which catches a release that came before we got here
+            captured, current = self.group.scan_captured()
+            if int_fired and self.last_edge_ns:
+                edge = (captured, self.last_edge_ns, getattr(self.int_source, "latency_ns", 0))
+            else:
+                edge = (captured, scan_ns, window_ns)
+            samples = (edge, (current, scan_ns, window_ns))
+        else:
+            samples = ((self.group.scan(), scan_ns, window_ns),)
 
-                elif any(self.touched):
-                    elapsed = time.time() - self.start_time
-                    self.led_on[0] = False
-                    print(f"LED OFF after {int(elapsed * 1000)} ms")
-                    self.start_time = None
-            time.sleep(0.05)
+        events = []
+        with self._lock:
+            if self.recorder is not None:
+                for val, timestamp_ns, window in samples:
+                    self.recorder.write(timestamp_ns, window, val)
+            for val, timestamp_ns, window in samples:
+                events.extend(self._process_sample(val, timestamp_ns, window))
+            self._resample_ns = self.debouncer.next_sample_ns
+            self._control_step()
+
+        # hand off to the dispatcher, never wait on it
+        for event in events:
+            self.ring.push(*event)
+
+    def _run_config_writes(self, writes):
+        """Write queued registers, an A/B pair (0x00/0x01, 0x0C/0x0D...) as one block.
+
+        Registers that end up at the value the chip already holds are not written.
+        """
+        pending = {}
+        callbacks = []
+        for addr, register, mask, value, _, callback in writes:
+            chip = self.group.chip(addr)
+            current = pending.get((addr, register), chip.shadow.get(register, 0x00))
+            pending[(addr, register)] = ((current & ~mask) | (value & mask)) & 0xFF
+            if callback:
+                callbacks.append(callback)
+
+        for addr, register in sorted(pending):
+            if (addr, register) not in pending:
+                continue  # written with its pair
+            chip = self.group.chip(addr)
+            value = pending.pop((addr, register))
+            pair = (addr, register ^ 1)
+            if register != IOCON and register % 2 == 0 and pair in pending:
+                high = pending.pop(pair)
+                chip.write16(register, value | (high << 8))
+            else:
+                chip.write_reg(register, value)
+
+        self._run_callbacks(callbacks)
+
+    def _olat_value(self):
+        """Called with _lock held."""
+        olat = 0
+        for i, led_state in enumerate(self.led_on):
+            if led_state:
+                olat |= self.led_masks[i]
+        return olat
+
+    def _process_sample(self, val, timestamp_ns, window_ns):
+        """Called with _lock held. Update touched_mask from a scan and return the events.
+
+        Only pins that changed are looked at, so a scan where nothing
+        happened costs a few bit ops no matter how many sensors there are.
+        An event is (sensor_index, pressed, timestamp_ns, raw, window_ns),
+        timed from the sample where the debounced change started.
+        """
+        raw = val
+        state, changed = self.debouncer.process(val & self.sensor_mask_all, timestamp_ns, window_ns)
+        if not changed:
+            return []
+        self.touched_mask = state
+
+        edges = []
+        while changed:
+            # lowest changed bit
+            bit = changed & -changed
+            changed ^= bit
+            sensor_index = self._pin_to_sensor[bit.bit_length() - 1]
+            edge_ns, edge_window_ns = self.debouncer.edge_time(bit, timestamp_ns, window_ns)
+            # set now = rising edge (touched), clear = falling edge (released)
+            edges.append((sensor_index, (state & bit) != 0, edge_ns, raw, edge_window_ns))
+        return edges
+
+    def _control_step(self):
+        """Called with _lock held. Debug LED: on, and off for a moment when touched."""
+        if not self.led_on:
+            return
+        if not self.led_on[0]:
+            self.led_on[0] = True
+            self.start_time = time.time()
+            self._request_led()
+            #print("LED ON")
+
+        elif self.touched_mask:
+            elapsed = time.time() - self.start_time
+            self.led_on[0] = False
+            self._request_led()
+            print(f"LED OFF after {int(elapsed * 1000)} ms")
+            self.start_time = None
+            # back on after one scan interval
+            self._control_due_ns = time.monotonic_ns() + int(self.scan_interval * 1e9)
 
 
     def cleanup(self):
-        """Turn off LED and close I2C bus."""
+        """Turn off LEDs and close I2C bus."""
+        if self.int_source is not None:
+            self.int_source.close()
         with self._lock:
-            self.bus.write_byte_data(self.ADDR, self.OLATA, 0x00)
-            self.bus.close()
+            self._running = False
+            self._wakeup.notify()
+        if self.bus_thread.is_alive():
+            self.bus_thread.join()
+        self.stop_recording()
+        self.ring.close()
+        if self.dispatch_thread is not None:
+            # don't hang on a callback that never returns
+            self.dispatch_thread.join(1.0)
+        self.group.write_outputs(0)
+        self.dump_bus_stats()
+        self.bus.close()
 
 
     def set_touch_callback(self, callback):
+        """callback(sensor_index, pressed), called from the dispatcher thread."""
         self._touch_callback = callback
+        self._start_dispatcher()
+
+    def set_event_callback(self, callback):
+        """callback(TouchEvent), called from the dispatcher thread."""
+        self._event_callback = callback
+        self._start_dispatcher()
 
 
 class TouchConsumer:
@@ -0,0 +1,70 @@
+import os
+import random
+import statistics
+import time
+
+# runs LedStrip against the simulated strip, no pi needed
+# python3 bench_render.py
+os.environ.setdefault("LED_BACKEND", "sim")
+
+from LedStrip import LedStrip, OVERLAY_LAYER
+from scheduler import Scheduler
+
+
+def report(name, led_strip, elapsed, writes):
+    sim = led_strip.strip.stats()
+    print(f"{name:<22} writes {writes:>6}  {writes / elapsed:>9.0f} writes/s  "
+          f"shows {sim['shows']:>5}  skipped {led_strip.frames_skipped:>5}  "
+          f"wire busy {sim['busy_ms']:>8.1f} ms  show wait {sim['wait_ms']:>8.1f} ms")
+
+
+def bench_per_pixel(led_count, writes):
+    # old behaviour, a show() for every write
+    led_strip = LedStrip(led_count=led_count)
+    start = time.perf_counter()
+    for i in range(writes):
+        led_strip.set_pixel(random.randrange(led_count), random.randrange(1, 0xFFFFFF))
+    report("show per set_pixel", led_strip, time.perf_counter() - start, writes)
+
+
+def bench_frames(led_count, writes, per_frame=10):
+    led_strip = LedStrip(led_count=led_count)
+    start = time.perf_counter()
+    for _ in range(writes // per_frame):
+        with led_strip.frame():
+            for _ in range(per_frame):
+                led_strip.set_pixel(random.randrange(led_count), random.randrange(1, 0xFFFFFF))
+    report(f"frame of {per_frame}", led_strip, time.perf_counter() - start, writes)
+
+
+def bench_render_loop(led_count, seconds, max_fps=60):
+    scheduler = Scheduler()
+    scheduler.start()
+    led_strip = LedStrip(led_count=led_count)
+    led_strip.start_render_loop(max_fps=max_fps, scheduler=scheduler)
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        led_strip.set_pixel(random.randrange(led_count), random.randrange(1, 0xFFFFFF))
+        if writes % 50 == 0:
+            led_strip.set_pixel(random.randrange(led_count), led_strip.red(),
+                                layer=OVERLAY_LAYER, duration=0.2)
+        writes += 1
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    led_strip.stop_render_loop()
+    scheduler.stop()
+    report(f"render loop {max_fps} fps", led_strip, elapsed, writes)
+
+    intervals = led_strip.strip.frame_intervals_ms()
+    if len(intervals) > 1:
+        print(f"{'':<22} frame interval mean {statistics.mean(intervals):.2f} ms  "
+              f"stdev {statistics.stdev(intervals):.2f} ms  max {max(intervals):.2f} ms")
+
+
+if __name__ == "__main__":
+    for led_count in (60, 300, 1000):
+        print(f"--- {led_count} leds ---")
+        bench_per_pixel(led_count, 200)
+        bench_frames(led_count, 2000)
+        bench_render_loop(led_count, 1.0)
@@ -0,0 +1,129 @@
+import os
+import statistics
+import sys
+import time
+
+# runs MCP23017TouchLED against the simulated bus and counts what it sends
+# python3 bench_touch.py            polling
+# python3 bench_touch.py int        interrupt mode
+# python3 bench_touch.py scan       8 chips x 16 sensors, scanning flat out
+# python3 bench_touch.py replay     record a session, replay it through the game
+os.environ.setdefault("I2C_BACKEND", "sim")
+os.environ.setdefault("LED_BACKEND", "sim")
+
+from i2c_bus import sim_bus, sim_device, TouchWaveform
+from gpio_edge import SimEdgeSource
+from TouchSensor import MCP23017TouchLED
+from touch_record import TouchRecording, play
+
+
+def bench(seconds=5.0, rate_hz=2.0, interrupt=False):
+    sensor_pins = [2, 3, 4, 5]
+    touches = []
+
+    chip = sim_device(0x27)
+    int_source = SimEdgeSource(chip) if interrupt else None
+    touch_led = MCP23017TouchLED(sensor_pins=sensor_pins, led_pins=[1], int_source=int_source)
+    touch_led.set_touch_callback(
+        lambda i, pressed: touches.append((time.monotonic(), i, pressed)))
+
+    waveform = TouchWaveform(seed=1).random_taps(sensor_pins, rate_hz, seconds)
+    touch_led.start()
+    time.sleep(0.1)
+    sim_bus().reset_stats()
+    played_at = time.monotonic()
+    chip.play(waveform.events)
+    time.sleep(seconds + 0.5)
+
+    stats = sim_bus().stats()
+    print(f"{'interrupt' if interrupt else 'polling'}: {seconds:.0f} s, "
+          f"{len(waveform.events)} scripted edges, {len(touches)} touch events")
+    print(f"bus: {stats['transactions']} transactions ({stats['transactions_per_s']:.1f}/s), "
+          f"{stats['bytes']} bytes, {stats['utilization'] * 100:.2f}% busy")
+    for op, count in sorted(stats["ops"].items()):
+        print(f"  {op:<22} {count}")
+
+    # edge -> callback latency, matching each event to the scripted edge before it
+    latencies = []
+    edges = [(played_at + offset, sensor_pins.index(pin), bool(level))
+             for offset, pin, level in waveform.events]
+    for at, i, pressed in touches:
+        before = [t for t, j, p in edges if j == i and p == pressed and t <= at]
+        if before:
+            latencies.append((at - before[-1]) * 1000)
+    if latencies:
+        print(f"latency mean {statistics.mean(latencies):.2f} ms  max {max(latencies):.2f} ms")
+
+
+def bench_scan(seconds=3.0, chips=8):
+    addrs = list(range(0x20, 0x20 + chips))
+    touch_led = MCP23017TouchLED(i2c_addr=addrs, sensor_pins=range(16 * chips),
+                                 led_pins=[], scan_interval=0)
+    touch_led.group.reset_scan_stats()
+    sim_bus().reset_stats()
+    touch_led.start()
+    time.sleep(seconds)
+    touch_led.cleanup()
+
+    scan = touch_led.scan_stats()
+    stats = sim_bus().stats()
+    print(f"{scan['chips']} chips, {16 * chips} sensors: {scan['scans_per_s']:.0f} scans/s, "
+          f"{scan['mean_scan_ms']:.2f} ms per scan, "
+          f"{stats['transactions'] / max(1, scan['scans']):.1f} transactions per scan")
+
+
+def bench_replay(seconds=3.0, path="/tmp/bench_touch.mcprec"):
+    # imported here, the other benchmarks don't need numpy or the led strip
+    from LedStrip import LedStrip, TouchConsumer2
+    from scheduler import Scheduler
+
+    sensor_pins = [2, 3, 4, 5]
+    chip = sim_device(0x27)
+    touch_led = MCP23017TouchLED(sensor_pins=sensor_pins, led_pins=[], scan_interval=0.002)
+    touch_led.record(path)
+    touch_led.start()
+    chip.play(TouchWaveform(seed=2).random_taps(sensor_pins, 8.0, seconds).events)
+    time.sleep(seconds + 0.2)
+    touch_led.cleanup()
+    recording = TouchRecording(path)
+    print(f"recorded {len(recording)} samples, {recording.duration_s():.1f} s")
+
+    # replay as fast as possible through touch -> game -> led strip, twice,
+    # and check both runs saw the same events
+    runs = []
+    for _ in range(2):
+        scheduler = Scheduler()
+        scheduler.start()
+        led_strip = LedStrip()
+        led_strip.start_render_loop(max_fps=60, scheduler=scheduler)
+        consumer = TouchConsumer2(led_strip, [15, 19, 23, 27], debounce_ms=0, scheduler=scheduler)
+        replay = MCP23017TouchLED(sensor_pins=sensor_pins, led_pins=[])
+        events = []
+
+        def on_event(event, events=events, consumer=consumer):
+            events.append(event)
+            consumer.on_touch_event(event)
+
+        replay.set_event_callback(on_event)
+        replay.start(scan=False)
+        result = play(recording, replay, realtime=False)
+        while len(events) < result["events"]:
+            time.sleep(0.001)
+        replay.cleanup()
+        led_strip.stop_render_loop()
+        scheduler.stop()
+        print(f"replay: {result['samples'] / result['seconds']:.0f} samples/s, "
+              f"{result['events']} events in {result['seconds'] * 1000:.1f} ms, "
+              f"{led_strip.frames_shown} frames")
+        first_ns = events[0].timestamp_ns if events else 0
+        runs.append([(e.sensor_index, e.pressed, e.timestamp_ns - first_ns) for e in events])
+    print("deterministic" if runs[0] == runs[1] else "runs differ!")
+
+
+if __name__ == "__main__":
+    if "scan" in sys.argv[1:]:
+        bench_scan()
+    elif "replay" in sys.argv[1:]:
+        bench_replay()
+    else:
+        bench(interrupt="int" in sys.argv[1:])
@@ -0,0 +1,245 @@
+import threading
+import time
+
+
+# bus instrumentation
+#
+# InstrumentedSMBus wraps an SMBus (smbus2 or the sim) and counts every call
+# per operation and register: calls, bytes on the wire, errors and a latency
+# histogram. TimedLock is a drop in for threading.Lock that records how long
+# each acquire waited. MCP23017TouchLED uses both when instrument=True (or
+# I2C_STATS=1) and prints them in cleanup(), see bus_stats() / dump_bus_stats().
+#
+# if the bus histograms are close to the wire time (bench_touch.py prints
+# it for the sim) the bus is the limit, if lock waits and the gaps between
+# transactions grow instead it's python.
+
+# LatencyHistogram resolution. values below 2**SUB_BITS ns are exact, above
+# that every power of two is split in 2**SUB_BITS buckets, so any value is
+# off by at most 1/16. MAX_BITS covers up to ~68 s
+SUB_BITS = 4
+MAX_BITS = 36
+_SUB_COUNT = 1 << SUB_BITS
+_BUCKETS = (MAX_BITS - SUB_BITS + 2) << SUB_BITS
+
+
+def _bucket(value):
+    if value < _SUB_COUNT:
+        return max(0, value)
+    shift = value.bit_length() - SUB_BITS - 1
+    index = ((shift + 1) << SUB_BITS) + (value >> shift) - _SUB_COUNT
+    return min(index, _BUCKETS - 1)
+
+
+def _bucket_value(index):
+    """Middle of the range a bucket covers."""
+    if index < _SUB_COUNT:
+        return index
+    shift = (index >> SUB_BITS) - 1
+    low = ((index & (_SUB_COUNT - 1)) + _SUB_COUNT) << shift
+    return low + (1 << shift) // 2
+
+
+class LatencyHistogram:
+    """Log-linear histogram of ns values in fixed memory, like HdrHistogram.
+
+    Not thread safe on its own, callers record under a lock they hold anyway.
+    """
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.reset()
+
+    def reset(self):
+        for i in range(_BUCKETS):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        self.counts[_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Value at percentile p (0-100), within the bucket precision."""
+        if not self.count:
+            return 0
+        rank = max(1, int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Dict of count, mean/min/p50/p90/p99/max in microseconds."""
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count,
+                "mean_us": self.total / self.count / 1000,
+                "min_us": self.min / 1000,
+                "p50_us": self.percentile(50) / 1000,
+                "p90_us": self.percentile(90) / 1000,
+                "p99_us": self.percentile(99) / 1000,
+                "max_us": self.max / 1000}
+
+
+class TimedLock:
+    """threading.Lock that records how long acquire() waited for it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait = LatencyHistogram()
+        self.contended = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.wait.record(0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter_ns()
+        if not self._lock.acquire(True, timeout):
+            return False
+        # recorded while holding the lock, so the histogram needs no other
+        self.wait.record(time.perf_counter_ns() - start)
+        self.contended += 1
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def summary(self):
+        summary = self.wait.summary()
+        summary["contended"] = self.contended
+        return summary
+
+
+class _OpStats:
+    __slots__ = ("calls", "bytes", "errors", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+
+class InstrumentedSMBus:
+    """Wraps an SMBus and records every call, see the top of this file."""
+
+    def __init__(self, bus, register_names=None):
+        self.bus = bus
+        self.register_names = register_names or {}
+        # (op, addr, register) -> _OpStats
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.started_ns = time.monotonic_ns()
+
+    def _call(self, op, addr, register, nbytes, fn, *args):
+        start = time.perf_counter_ns()
+        try:
+            result = fn(addr, register, *args)
+        except OSError:
+            self._record(op, addr, register, 0, start, error=True)
+            raise
+        self._record(op, addr, register, nbytes, start)
+        return result
+
+    def _record(self, op, addr, register, nbytes, start, error=False):
+        elapsed = time.perf_counter_ns() - start
+        key = (op, addr, register)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _OpStats()
+            stats.calls += 1
+            stats.latency.record(elapsed)
+            if error:
+                stats.errors += 1
+            else:
+                stats.bytes += nbytes
+
+    # the SMBus calls the touch code makes. bytes are what goes over the
+    # wire after the address byte: register, then the data
+    def read_byte_data(self, i2c_addr, register, force=None):
+        return self._call("read_byte_data", i2c_addr, register, 2,
+                          self.bus.read_byte_data)
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        return self._call("write_byte_data", i2c_addr, register, 2,
+                          self.bus.write_byte_data, value)
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        return self._call("read_i2c_block_data", i2c_addr, register, 1 + length,
+                          self.bus.read_i2c_block_data, length)
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        return self._call("write_i2c_block_data", i2c_addr, register, 1 + len(data),
+                          self.bus.write_i2c_block_data, data)
+
+    def close(self):
+        self.bus.close()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.started_ns = time.monotonic_ns()
+
+    def stats(self):
+        """List of dicts, one per (op, addr, register), busiest first."""
+        with self._lock:
+            items = list(self._stats.items())
+            seconds = max(1e-9, (time.monotonic_ns() - self.started_ns) / 1e9)
+        rows = []
+        for (op, addr, register), stats in items:
+            row = {"op": op, "addr": addr, "register": register,
+                   "name": self.register_names.get(register, f"0x{register:02X}"),
+                   "calls": stats.calls, "calls_per_s": stats.calls / seconds,
+                   "bytes": stats.bytes, "errors": stats.errors}
+            row.update(stats.latency.summary())
+            rows.append(row)
+        rows.sort(key=lambda row: row["calls"], reverse=True)
+        return rows
+
+    def totals(self):
+        """Calls, bytes, errors and time spent in the bus over every op."""
+        with self._lock:
+            stats = list(self._stats.values())
+        return {"calls": sum(s.calls for s in stats),
+                "bytes": sum(s.bytes for s in stats),
+                "errors": sum(s.errors for s in stats),
+                "busy_ms": sum(s.latency.total for s in stats) / 1e6}
+
+    def dump(self, extra=None):
+        """Print the table. extra is {name: LatencyHistogram summary} printed below it."""
+        totals = self.totals()
+        print(f"[I2C] {totals['calls']} calls, {totals['bytes']} bytes, "
+              f"{totals['errors']} errors, {totals['busy_ms']:.1f} ms in the bus")
+        print(f"[I2C] {'op':<21} {'addr':>4} {'reg':<9} {'calls':>7} {'/s':>7} {'bytes':>8} "
+              f"{'err':>4} {'p50us':>7} {'p99us':>7} {'maxus':>7}")
+        for row in self.stats():
+            print(f"[I2C] {row['op']:<21} 0x{row['addr']:02X} {row['name']:<9} {row['calls']:>7} "
+                  f"{row['calls_per_s']:>7.1f} {row['bytes']:>8} {row['errors']:>4} "
+                  f"{row['p50_us']:>7.0f} {row['p99_us']:>7.0f} {row['max_us']:>7.0f}")
+        for name, summary in (extra or {}).items():
+            if summary.get("count"):
+                print(f"[I2C] {name}: {summary['count']} acquires, "
+                      f"{summary.get('contended', 0)} waited, "
+                      f"p99 {summary['p99_us']:.0f} us, max {summary['max_us']:.0f} us")
@@ -0,0 +1,197 @@
+# debouncing for the touch driver
+#
+# works on the raw scan bitmask like the driver does, so each strategy is a
+# few and/or/xor over all its pins at once instead of a loop per sensor.
+# pins that are not in any group go straight through.
+#
+#   LOCKOUT     take the first edge right away, then ignore the pin for
+#               lockout_ms. fastest response, good for clean sensors
+#   INTEGRATOR  take a change once it has been seen in `samples` scans in
+#               a row. slower but ignores single-scan glitches
+#   HYSTERESIS  an integrator with separate press_samples / release_samples,
+#               eg. quick presses but a release only after it's really gone
+#
+# a "bounce" is a pin that changed and went back to its accepted state
+# before the change was taken. those are counted per pin in rejected, next
+# to accepted edges and the shortest press that got through, so a strategy
+# can be tuned until rejected stops growing without shortest_press_ns
+# creeping up past real fast taps.
+#
+# debouncer = Debouncer(sample_interval_ms=5)
+# debouncer.add(0b111100, INTEGRATOR, samples=3)
+# state, changed = debouncer.process(raw, time.monotonic_ns())
+
+LOCKOUT = "lockout"
+INTEGRATOR = "integrator"
+HYSTERESIS = "hysteresis"
+
+
+def _bits(mask):
+    """Single bit masks of mask, lowest first."""
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        yield bit
+
+
+class Debouncer:
+    def __init__(self, sample_interval_ms=5):
+        # how soon to look again while an integrator is counting
+        self.sample_interval_ns = int(sample_interval_ms * 1e6)
+
+        self.state = 0       # accepted state, bit = pin
+        self._raw = 0        # previous raw sample
+        # (mask, press_samples, release_samples) per integrator/hysteresis group
+        self._groups = []
+        self._history = []   # last raw samples, newest at the end
+        self._history_len = 0
+
+        self._lockout_mask = 0
+        self._lockout_ns = {}     # bit -> lockout length
+        self._locked = 0
+        self._unlock_ns = {}      # bit -> monotonic_ns the lockout ends
+
+        # bit -> (timestamp_ns, window_ns) of the sample where the pin last
+        # changed, which is when an accepted edge really started
+        self._changed_at = {}
+        self._pressed_at = {}
+        # next time a sample is needed to settle a pending pin, or None
+        self.next_sample_ns = None
+
+        # stats, bit -> count / ns
+        self.accepted = {}
+        self.rejected = {}
+        self.shortest_press_ns = {}
+
+    def add(self, mask, strategy, lockout_ms=30, samples=3,
+            press_samples=None, release_samples=None):
+        """Debounce the pins in mask with strategy. Replaces their previous one."""
+        self.remove(mask)
+        if strategy == LOCKOUT:
+            self._lockout_mask |= mask
+            for bit in _bits(mask):
+                self._lockout_ns[bit] = int(lockout_ms * 1e6)
+        elif strategy in (INTEGRATOR, HYSTERESIS):
+            press = press_samples or samples
+            release = release_samples or samples
+            if press < 1 or release < 1:
+                raise ValueError("sample counts must be at least 1")
+            self._groups.append((mask, press, release))
+            self._history_len = max(self._history_len, press, release)
+        else:
+            raise ValueError(f"unknown debounce strategy {strategy!r}")
+
+    def remove(self, mask):
+        """Pins in mask go straight through again."""
+        self._lockout_mask &= ~mask
+        self._locked &= ~mask
+        for bit in _bits(mask):
+            self._lockout_ns.pop(bit, None)
+            self._unlock_ns.pop(bit, None)
+        groups = []
+        for group_mask, press, release in self._groups:
+            group_mask &= ~mask
+            if group_mask:
+                groups.append((group_mask, press, release))
+        self._groups = groups
+        self._history_len = max([0] + [max(p, r) for _, p, r in self._groups])
+
+    def pending(self):
+        """Pins whose raw value differs from the accepted state."""
+        return self._raw ^ self.state
+
+    def process(self, raw, timestamp_ns, window_ns=0):
+        """Feed one scan. Returns (state, changed), changed = pins that flipped in state."""
+        toggled = raw ^ self._raw
+        self._raw = raw
+        old = self.state
+
+        # a pin back at its accepted state right after changing was a bounce
+        bounced = toggled & ~(raw ^ old)
+        for bit in _bits(bounced):
+            self.rejected[bit] = self.rejected.get(bit, 0) + 1
+        for bit in _bits(toggled):
+            self._changed_at[bit] = (timestamp_ns, window_ns)
+
+        debounced = self._lockout_mask
+        new = old
+
+        # integrators: high in the last `press` samples / low in the last `release`
+        if self._groups:
+            history = self._history
+            history.append(raw)
+            if len(history) > self._history_len:
+                del history[0]
+            for mask, press, release in self._groups:
+                debounced |= mask
+                # nothing is taken until there are enough samples to count
+                high = mask if len(history) >= press else 0
+                for sample in history[-press:]:
+                    high &= sample
+                seen = mask if len(history) < release else 0
+                for sample in history[-release:]:
+                    seen |= sample
+                low = mask & ~seen
+                new = (new | high) & ~low
+
+        # lockout: pins still locked keep their state, the rest follow raw
+        if self._lockout_mask:
+            if self._locked:
+                for bit in _bits(self._locked):
+                    if timestamp_ns >= self._unlock_ns[bit]:
+                        self._locked &= ~bit
+                        del self._unlock_ns[bit]
+            take = (raw ^ old) & self._lockout_mask & ~self._locked
+            new ^= take
+            for bit in _bits(take):
+                self._locked |= bit
+                self._unlock_ns[bit] = timestamp_ns + self._lockout_ns[bit]
+
+        # pins nobody debounces
+        passthrough = ~debounced
+        new = (new & debounced) | (raw & passthrough)
+
+        self.state = new
+        changed = new ^ old
+        for bit in _bits(changed):
+            self.accepted[bit] = self.accepted.get(bit, 0) + 1
+            started_ns = self._changed_at.get(bit, (timestamp_ns, window_ns))[0]
+            if new & bit:
+                self._pressed_at[bit] = started_ns
+            elif bit in self._pressed_at:
+                held = started_ns - self._pressed_at.pop(bit)
+                if held < self.shortest_press_ns.get(bit, held + 1):
+                    self.shortest_press_ns[bit] = held
+
+        self._plan_next_sample(timestamp_ns)
+        return new, changed
+
+    def edge_time(self, bit, timestamp_ns, window_ns):
+        """(timestamp_ns, window_ns) of the sample where an accepted edge on bit started."""
+        return self._changed_at.get(bit, (timestamp_ns, window_ns))
+
+    def _plan_next_sample(self, now_ns):
+        # pins that still differ only settle with another sample: soon for an
+        # integrator, when the lock ends for a lockout. in interrupt mode
+        # nothing else would read the chip again
+        pending = self._raw ^ self.state
+        deadline = None
+        if pending & ~self._lockout_mask:
+            deadline = now_ns + self.sample_interval_ns
+        for bit in _bits(pending & self._locked):
+            unlock = self._unlock_ns[bit]
+            if deadline is None or unlock < deadline:
+                deadline = unlock
+        self.next_sample_ns = deadline
+
+    def stats(self):
+        """{bit: (accepted, rejected, shortest_press_ns)} for every pin seen."""
+        bits = set(self.accepted) | set(self.rejected)
+        return {bit: (self.accepted.get(bit, 0), self.rejected.get(bit, 0),
+                      self.shortest_press_ns.get(bit))
+                for bit in sorted(bits)}
+
+    def reset_stats(self):
+        self.accepted = {}
+        self.rejected = {}
+        self.shortest_press_ns = {}
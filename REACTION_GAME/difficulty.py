@@ -0,0 +1,126 @@
+import random
+
+
+# difficulty
+#
+# TouchConsumer2 asks its difficulty for three things each round: how long
+# to wait before the targets go on (gap), which sensors to light
+# (pick_targets) and, through that, how many at once. after every hit or
+# wrong touch it calls update(), so the next round can adapt.
+#
+#   FixedDifficulty     the original rules: uniform(0, max_gap), one target
+#                       picked uniformly. nothing adapts
+#   AdaptiveDifficulty  a level between 0 (easy) and 1 (hard) follows the
+#                       player: hits faster than target_s push it up, slower
+#                       hits and wrong touches pull it down. the level
+#                       shortens the gap and adds concurrent targets, and
+#                       slower sensors are picked more often
+#
+# everything is a handful of float operations per call, independent of how
+# many trials have been played. the reaction mode (game_modes.py) asks for
+# each round while the one before it is played, so none of it runs between
+# a touch and the next led going on. adaptive tells the mode whether it has
+# to ask round by round or can draw the whole game up front.
+#
+# tracker = ReactionTracker()
+# difficulty = AdaptiveDifficulty(tracker, sensors=4)
+# consumer = TouchConsumer2(strip, pins, difficulty=difficulty)
+
+
+class FixedDifficulty:
+    adaptive = False
+
+    def __init__(self, sensors, max_gap=3.0, rng=None):
+        self.sensors = sensors
+        self.max_gap = max_gap
+        self.rng = rng or random.Random()
+
+    def gap(self):
+        return self.rng.uniform(0, self.max_gap)
+
+    def pick_targets(self):
+        """Sensor indexes to light this round."""
+        return [self.rng.randrange(self.sensors)]
+
+    def update(self, sensor_index, reaction_s=None):
+        """A hit (reaction_s) or a wrong touch (reaction_s None) on sensor_index."""
+
+    def summary(self):
+        return {"level": 0.0, "targets": 1, "max_gap": self.max_gap}
+
+
+class AdaptiveDifficulty:
+    adaptive = True
+
+    def __init__(self, tracker, sensors, target_s=0.5, min_gap=0.5, max_gap=3.0,
+                 max_targets=3, gain=0.1, wrong_penalty=0.1, slow_bias=2.0, rng=None):
+        # per sensor reaction trends come from the ReactionTracker the game
+        # already updates, the controller keeps no history of its own
+        self.tracker = tracker
+        self.sensors = sensors
+        # the reaction time the level settles at
+        self.target_s = target_s
+        # the gap goes from uniform(0, max_gap) at level 0 to
+        # uniform(0, min_gap) at level 1. never above max_gap, or the gap
+        # would grow as the player gets better
+        self.min_gap = min(min_gap, max_gap)
+        self.max_gap = max_gap
+        self.max_targets = max(1, min(max_targets, sensors))
+        self.gain = gain
+        self.wrong_penalty = wrong_penalty
+        # weight of a sensor is its trend ** slow_bias, 0 picks uniformly
+        self.slow_bias = slow_bias
+        self.rng = rng or random.Random()
+        self.level = 0.0
+
+        # sensors without a trend yet weigh like a player right on target
+        default = target_s ** slow_bias
+        self.weights = [default] * sensors
+        self._total = default * sensors
+
+    def gap(self):
+        return self.rng.uniform(0, self.max_gap - self.level * (self.max_gap - self.min_gap))
+
+    def targets(self):
+        """How many targets to light at once at the current level."""
+        return min(self.max_targets, 1 + int(self.level * self.max_targets))
+
+    def pick_targets(self):
+        """Distinct sensor indexes to light this round, slower sensors more likely."""
+        picked = []
+        total = self._total
+        for _ in range(self.targets()):
+            x = self.rng.random() * total
+            choice = None
+            for i, weight in enumerate(self.weights):
+                if i in picked:
+                    continue
+                choice = i
+                x -= weight
+                if x < 0:
+                    break
+            picked.append(choice)
+            total -= self.weights[choice]
+        return picked
+
+    def update(self, sensor_index, reaction_s=None):
+        """A hit (reaction_s) or a wrong touch (reaction_s None) on sensor_index."""
+        if reaction_s is None:
+            self._set_level(self.level - self.wrong_penalty)
+            return
+        # relative error, capped so one lapse can't throw the level around
+        error = max(-1.0, min(1.0, (self.target_s - reaction_s) / self.target_s))
+        self._set_level(self.level + self.gain * error)
+
+        stats = self.tracker.by_sensor.get(sensor_index)
+        if stats is not None and stats.trend.value is not None and sensor_index < self.sensors:
+            weight = stats.trend.value ** self.slow_bias
+            self._total += weight - self.weights[sensor_index]
+            self.weights[sensor_index] = weight
+
+    def _set_level(self, level):
+        self.level = max(0.0, min(1.0, level))
+
+    def summary(self):
+        return {"level": self.level, "targets": self.targets(),
+                "max_gap": self.max_gap - self.level * (self.max_gap - self.min_gap)}
@@ -0,0 +1,159 @@
+import numpy as np
+
+
+# game modes
+#
+# a mode only decides what the player has to do: it turns into a schedule,
+# a sequence of Steps, when a game starts. TouchConsumer2 is the runtime
+# that plays any schedule on the strip: it waits each step's gap, lights
+# (or shows) its targets, checks the touches against them and keeps the
+# stats and the store up to date. the modes here:
+#
+#   reaction  one target at a time after a random gap, the original game.
+#             follows the consumer's difficulty, see difficulty.py
+#   sequence  simon says: a sequence is shown one led at a time, then
+#             repeated by the player in order. one longer every round, a
+#             wrong touch ends the round
+#   whack     whack-a-mole: a few moles at once, each round they go back
+#             down after up_s whether hit or not
+#   rush      as many targets as possible in duration_s, the next one goes
+#             on as soon as the last is hit
+#
+# schedules are drawn with numpy when the game starts and the runtime takes
+# the next step while the current one is being played, so a touch is
+# followed by a timer for a step that already exists, nothing is drawn or
+# built in between. schedule() may also return a generator for modes that
+# depend on how the game goes (an adaptive difficulty) or never end (rush),
+# it's still read one step ahead.
+#
+# a new mode is a GameMode with schedule(), put in MODES to pick it by name:
+#   consumer = TouchConsumer2(strip, pins, mode=WhackMode(tries=30))
+#   consumer.set_mode("sequence")
+
+
+class Step:
+    """One round: wait gap seconds, then the player touches targets (sensor indexes).
+
+    ordered   the targets have to be touched in the order given
+    show_s    the targets are shown one after the other for show_s each and
+              then go off, the player repeats them from memory
+    timeout   seconds the player has before the untouched targets count as
+              missed, None waits for ever
+    """
+    __slots__ = ("gap", "targets", "ordered", "show_s", "timeout", "mask", "leds")
+
+    def __init__(self, gap, targets, ordered=False, show_s=None, timeout=None):
+        self.gap = float(gap)
+        self.targets = tuple(int(t) for t in targets)
+        self.ordered = ordered
+        self.show_s = show_s
+        self.timeout = timeout
+        # bit per target sensor, and the leds once compile() has run
+        self.mask = 0
+        for t in self.targets:
+            self.mask |= 1 << t
+        self.leds = None
+
+    def compile(self, strip_led_pins):
+        self.leds = tuple(strip_led_pins[t] for t in self.targets)
+        return self
+
+    def __repr__(self):
+        return f"Step(gap={self.gap:.2f}, targets={self.targets})"
+
+
+class GameMode:
+    name = None
+    # rounds in a game, None if the game runs for duration_s instead. a
+    # mode that counts rounds sets it on the class and takes tries=, so
+    # TouchConsumer2.set_mode() can pass its own when building one by name
+    tries = None
+    duration_s = None
+
+    def schedule(self, sensors, rng, difficulty):
+        """Steps for one game. rng is a numpy Generator, difficulty the consumer's."""
+        raise NotImplementedError
+
+
+class ReactionMode(GameMode):
+    name = "reaction"
+    tries = 10
+
+    def __init__(self, tries=10):
+        self.tries = tries
+
+    def schedule(self, sensors, rng, difficulty):
+        if getattr(difficulty, "adaptive", False):
+            # the level moves with every hit, so each step is asked for
+            # when it's read (one round ahead)
+            return (Step(difficulty.gap(), difficulty.pick_targets()) for _ in range(self.tries))
+        return [Step(difficulty.gap(), difficulty.pick_targets()) for _ in range(self.tries)]
+
+
+class SequenceMode(GameMode):
+    name = "sequence"
+    tries = 5
+
+    def __init__(self, tries=5, start_length=3, show_s=0.6, gap=1.0):
+        self.tries = tries
+        self.start_length = start_length
+        self.show_s = show_s
+        self.gap = gap
+
+    def schedule(self, sensors, rng, difficulty):
+        # every round repeats the one before and adds one more. like rush,
+        # never the same sensor twice in a row: the game's debounce would
+        # drop the second tap and the next one would end the round
+        length = self.start_length + self.tries - 1
+        if sensors > 1:
+            sequence = ((int(rng.integers(0, sensors)) +
+                         np.cumsum(rng.integers(1, sensors, length))) % sensors).tolist()
+        else:
+            sequence = [0] * length
+        return [Step(self.gap, sequence[:self.start_length + i], ordered=True, show_s=self.show_s)
+                for i in range(self.tries)]
+
+
+class WhackMode(GameMode):
+    name = "whack"
+    tries = 20
+
+    def __init__(self, tries=20, moles=(1, 3), up_s=1.2, gap=(0.2, 0.8)):
+        self.tries = tries
+        self.moles = moles
+        self.up_s = up_s
+        self.gap = gap
+
+    def schedule(self, sensors, rng, difficulty):
+        low, high = min(self.moles[0], sensors), min(self.moles[1], sensors)
+        counts = rng.integers(low, high + 1, self.tries)
+        gaps = rng.uniform(self.gap[0], self.gap[1], self.tries)
+        # distinct sensors per round: the first `count` of a random order
+        order = np.argsort(rng.random((self.tries, sensors)), axis=1)
+        return [Step(gap, order[i, :count], timeout=self.up_s)
+                for i, (gap, count) in enumerate(zip(gaps.tolist(), counts.tolist()))]
+
+
+class RushMode(GameMode):
+    name = "rush"
+
+    def __init__(self, duration_s=30.0, gap=0.0, chunk=256):
+        self.duration_s = duration_s
+        self.gap = gap
+        self.chunk = chunk
+
+    def schedule(self, sensors, rng, difficulty):
+        last = int(rng.integers(0, sensors))
+        while True:
+            # never the same sensor twice in a row, the game's debounce
+            # would drop the second touch
+            if sensors > 1:
+                targets = (last + np.cumsum(rng.integers(1, sensors, self.chunk))) % sensors
+            else:
+                targets = np.zeros(self.chunk, dtype=np.int64)
+            steps = [Step(self.gap, (t,)) for t in targets.tolist()]
+            last = steps[-1].targets[0]
+            yield from steps
+
+
+MODES = {mode.name: mode for mode in (ReactionMode, SequenceMode, WhackMode, RushMode)}
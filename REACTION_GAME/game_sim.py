@@ -0,0 +1,154 @@
+import itertools
+import sys
+import time
+
+import numpy as np
+
+
+# headless simulator of the TouchConsumer2 rules
+#
+# a whole batch of games is drawn at once as (games, tries) numpy arrays,
+# so a parameter grid can be explored without anyone at a station:
+#   - the gap before each target is uniform(0, max_gap)
+#   - the player's reaction is log-normal, with an occasional lapse
+#   - before the right sensor some trials get wrong touches, each costing time
+#   - a press on the same sensor as the previous hit within debounce_ms is
+#     dropped by the game, so the player has to touch again
+#   - now and then a player rests a hand on two sensors. if those are the
+#     start combo and stay down for hold_s the game resets (a false reset)
+#
+# python3 game_sim.py            default grid, printed as a table
+# python3 game_sim.py bench      simulated trials per second
+
+# the game's defaults, see TouchConsumer2
+GAME = {"tries": 10, "debounce_ms": 300, "max_gap": 3.0, "hold_s": 1.0, "sensors": 4}
+
+
+class ReactionModel:
+    """How a simulated player behaves. Times in seconds."""
+
+    def __init__(self, median_s=0.45, sigma=0.3, p_lapse=0.02, lapse_s=2.0,
+                 p_wrong=0.1, wrong_s=0.4, retouch_s=0.35,
+                 p_rest=0.01, rest_median_s=0.4, rest_sigma=1.0):
+        self.median_s = median_s
+        self.sigma = sigma
+        # a lapse adds an exponential delay with mean lapse_s
+        self.p_lapse = p_lapse
+        self.lapse_s = lapse_s
+        # chance of a wrong touch before the right one, repeated (geometric)
+        self.p_wrong = p_wrong
+        self.wrong_s = wrong_s
+        # time to touch again when a press got no response
+        self.retouch_s = retouch_s
+        # chance per trial of resting on two sensors, and for how long
+        self.p_rest = p_rest
+        self.rest_median_s = rest_median_s
+        self.rest_sigma = rest_sigma
+
+
+def simulate(games=10000, model=None, rng=None, **config):
+    """Play `games` games with the TouchConsumer2 rules. config overrides GAME.
+
+    Returns per game arrays: length_s, total_reaction_s, wrong_touches,
+    dropped_presses and false_reset (bool).
+    """
+    model = model or ReactionModel()
+    rng = rng if rng is not None else np.random.default_rng()
+    cfg = dict(GAME, **config)
+    tries, sensors = cfg["tries"], cfg["sensors"]
+    shape = (games, tries)
+
+    gap = rng.uniform(0.0, cfg["max_gap"], shape)
+    reaction = rng.lognormal(np.log(model.median_s), model.sigma, shape)
+    lapse = rng.random(shape) < model.p_lapse
+    reaction += np.where(lapse, rng.exponential(model.lapse_s, shape), 0.0)
+
+    # wrong touches happen while reacting, they delay the right one
+    wrong = rng.geometric(1.0 - model.p_wrong, shape) - 1 if model.p_wrong > 0 \
+        else np.zeros(shape, dtype=np.int64)
+    reaction += wrong * model.wrong_s
+
+    # same sensor as the previous hit and too soon after it: the game's
+    # debounce drops the press and the player touches again
+    target = rng.integers(0, sensors, shape)
+    same = np.zeros(shape, dtype=bool)
+    same[:, 1:] = target[:, 1:] == target[:, :-1]
+    debounce_s = cfg["debounce_ms"] / 1000.0
+    dropped = np.zeros(shape, dtype=np.int64)
+    if debounce_s > 0 and model.retouch_s > 0:
+        since_last = gap + reaction
+        while True:
+            hit = same & (since_last < debounce_s)
+            if not hit.any():
+                break
+            dropped += hit
+            reaction = reaction + hit * model.retouch_s
+            since_last = since_last + hit * model.retouch_s
+
+    # a rest on two sensors that happen to be the combo, held long enough
+    pairs = sensors * (sensors - 1) / 2
+    rest = rng.random(shape) < model.p_rest
+    on_combo = rng.random(shape) < 1.0 / pairs
+    rest_s = rng.lognormal(np.log(model.rest_median_s), model.rest_sigma, shape)
+    false_reset = (rest & on_combo & (rest_s >= cfg["hold_s"])).any(axis=1)
+
+    return {"length_s": (gap + reaction).sum(axis=1),
+            "total_reaction_s": reaction.sum(axis=1),
+            "wrong_touches": wrong.sum(axis=1),
+            "dropped_presses": dropped.sum(axis=1),
+            "false_reset": false_reset}
+
+
+def summarize(result):
+    length = result["length_s"]
+    score = result["total_reaction_s"]
+    return {"games": len(length),
+            "length_p50_s": float(np.percentile(length, 50)),
+            "length_p90_s": float(np.percentile(length, 90)),
+            "score_p50_s": float(np.percentile(score, 50)),
+            "score_p90_s": float(np.percentile(score, 90)),
+            "wrong_mean": float(result["wrong_touches"].mean()),
+            "dropped_mean": float(result["dropped_presses"].mean()),
+            "false_reset_rate": float(result["false_reset"].mean())}
+
+
+def run_grid(grid, games=10000, model=None, seed=0):
+    """simulate() every combination of grid ({name: [values]}). Returns [(config, summary)]."""
+    rng = np.random.default_rng(seed)
+    names = list(grid)
+    rows = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        config = dict(zip(names, values))
+        rows.append((config, summarize(simulate(games, model, rng, **config))))
+    return rows
+
+
+def print_grid(rows):
+    names = list(rows[0][0]) if rows else []
+    header = " ".join(f"{name:>11}" for name in names)
+    print(f"{header} {'len p50':>8} {'len p90':>8} {'score p50':>9} {'score p90':>9} "
+          f"{'wrong':>6} {'dropped':>7} {'false rst':>9}")
+    for config, s in rows:
+        values = " ".join(f"{config[name]:>11}" for name in names)
+        print(f"{values} {s['length_p50_s']:>8.1f} {s['length_p90_s']:>8.1f} "
+              f"{s['score_p50_s']:>9.2f} {s['score_p90_s']:>9.2f} {s['wrong_mean']:>6.2f} "
+              f"{s['dropped_mean']:>7.3f} {s['false_reset_rate'] * 100:>8.2f}%")
+
+
+def bench(games=200000, tries=10):
+    simulate(1000, tries=tries)  # warm up
+    start = time.perf_counter()
+    simulate(games, tries=tries)
+    elapsed = time.perf_counter() - start
+    print(f"{games * tries} trials in {elapsed * 1000:.0f} ms: "
+          f"{games * tries / elapsed / 1e6:.1f} M trials/s")
+
+
+if __name__ == "__main__":
+    if "bench" in sys.argv[1:]:
+        bench()
+    else:
+        print_grid(run_grid({"tries": [5, 10],
+                             "debounce_ms": [0, 300, 600],
+                             "max_gap": [1.5, 3.0],
+                             "hold_s": [0.5, 1.0]}))
@@ -0,0 +1,174 @@
+import threading
+import time
+
+
+# gestures on top of touch events
+#
+# each gesture is a small state machine over a bitmask of the sensors it
+# uses (bit = sensor index), stepped by the engine on every touch event.
+# holds set a one-shot timer on the station's Scheduler instead of polling,
+# so any number of gestures cost nothing while nobody touches anything.
+#
+#   Chord(sensors, hold)        all of sensors down together for hold seconds
+#   Hold(sensor, hold)          long press, a chord of one
+#   DoubleTap(sensor, within)   two presses no more than within seconds apart
+#   Sequence(sensors, within)   presses in that order, each within of the last
+#
+# presses on sensors a gesture doesn't use are ignored by it. callbacks run
+# on the scheduler thread, the same one the game runs on.
+#
+# gestures = GestureEngine(scheduler)
+# gestures.add(Chord([0, 1], hold=1.0), reset_game)
+# gestures.add(DoubleTap(3), toggle_pause)
+# touch_led.set_event_callback(gestures.on_touch_event)
+
+
+def _mask(sensors):
+    mask = 0
+    for i in sensors:
+        mask |= 1 << i
+    return mask
+
+
+class Chord:
+    def __init__(self, sensors, hold=0.0):
+        self.sensors = tuple(sensors)
+        self.mask = _mask(self.sensors)
+        self.hold = hold
+        self._timer = None
+        # fires once per time the chord is made, not again until it's let go
+        self._fired = False
+
+    def step(self, engine, pressed_mask, bit, pressed, timestamp_ns):
+        complete = pressed_mask & self.mask == self.mask
+        if not complete:
+            self._fired = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return False
+        if self._fired or self._timer is not None:
+            return False
+        if self.hold <= 0:
+            self._fired = True
+            return True
+        self._timer = engine.scheduler.call_later(self.hold, engine._timer_fired, self)
+        return False
+
+    def timer_fired(self, pressed_mask):
+        # let go just as the timer went off
+        if self._timer is None or pressed_mask & self.mask != self.mask:
+            return False
+        self._timer = None
+        self._fired = True
+        return True
+
+    def __repr__(self):
+        return f"Chord({list(self.sensors)}, hold={self.hold})"
+
+
+class Hold(Chord):
+    def __init__(self, sensor, hold=1.0):
+        super().__init__([sensor], hold)
+
+    def __repr__(self):
+        return f"Hold({self.sensors[0]}, hold={self.hold})"
+
+
+class DoubleTap:
+    def __init__(self, sensor, within=0.4):
+        self.sensor = sensor
+        self.mask = 1 << sensor
+        self.within_ns = int(within * 1e9)
+        self._last_ns = None
+
+    def step(self, engine, pressed_mask, bit, pressed, timestamp_ns):
+        if not pressed:
+            return False
+        last = self._last_ns
+        if last is not None and timestamp_ns - last <= self.within_ns:
+            self._last_ns = None  # a third tap starts over
+            return True
+        self._last_ns = timestamp_ns
+        return False
+
+    def __repr__(self):
+        return f"DoubleTap({self.sensor}, within={self.within_ns / 1e9})"
+
+
+class Sequence:
+    def __init__(self, sensors, within=1.0):
+        self.sensors = tuple(sensors)
+        self.mask = _mask(self.sensors)
+        self.within_ns = int(within * 1e9)
+        self._bits = [1 << i for i in self.sensors]
+        self._pos = 0
+        self._last_ns = None
+
+    def step(self, engine, pressed_mask, bit, pressed, timestamp_ns):
+        if not pressed:
+            return False
+        late = self._pos and timestamp_ns - self._last_ns > self.within_ns
+        if late or bit != self._bits[self._pos]:
+            # wrong sensor or too slow, this press may still start it again
+            self._pos = 1 if bit == self._bits[0] else 0
+        else:
+            self._pos += 1
+        self._last_ns = timestamp_ns
+        if self._pos == len(self._bits):
+            self._pos = 0
+            return True
+        return False
+
+    def __repr__(self):
+        return f"Sequence({list(self.sensors)}, within={self.within_ns / 1e9})"
+
+
+class GestureEngine:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.pressed_mask = 0
+        # gesture -> [(callback, args)], in the order they were added
+        self._gestures = {}
+        # on_touch comes from the touch driver's thread, hold timers from the
+        # scheduler's, both step the same state
+        self._lock = threading.Lock()
+
+    def add(self, gesture, callback, *args):
+        """Call callback(*args) on the scheduler thread whenever gesture is made."""
+        with self._lock:
+            self._gestures.setdefault(gesture, []).append((callback, args))
+        return gesture
+
+    def remove(self, gesture):
+        with self._lock:
+            self._gestures.pop(gesture, None)
+
+    def on_touch_event(self, event):
+        self.on_touch(event.sensor_index, event.pressed, event.timestamp_ns)
+
+    def on_touch(self, sensor_index, pressed=True, timestamp_ns=None):
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        bit = 1 << sensor_index
+        fired = []
+        with self._lock:
+            if pressed:
+                self.pressed_mask |= bit
+            else:
+                self.pressed_mask &= ~bit
+            for gesture, callbacks in self._gestures.items():
+                if gesture.mask & bit and gesture.step(
+                        self, self.pressed_mask, bit, pressed, timestamp_ns):
+                    fired.extend(callbacks)
+        for callback, args in fired:
+            self.scheduler.call_soon(callback, *args)
+
+    def _timer_fired(self, gesture):
+        # runs on the scheduler thread already
+        with self._lock:
+            if gesture not in self._gestures or not gesture.timer_fired(self.pressed_mask):
+                return
+            fired = list(self._gestures[gesture])
+        for callback, args in fired:
+            callback(*args)
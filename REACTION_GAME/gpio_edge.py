@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+# edge sources for the MCP23017 interrupt line
+#
+# the driver only needs two things from one:
+#   set_callback(fn)  fn(timestamp_ns) runs when the line becomes active
+#   asserted()        True while the line is active
+# so tests can hand it SimEdgeSource instead of a real gpio. latency_ns says
+# how late after the real edge the callback can run, it ends up as the
+# timing uncertainty of the touch.
+#
+# | MCP23017 | Raspberry Pi    |
+# | -------- | --------------- |
+# | INTA     | GPIO17 (pin 11) |
+# | INTB     | GPIO27 (pin 13) |
+#
+# INTA is active low and open drain (IOCON.ODR, with MIRROR so either port
+# drives it), so every chip's INTA can share the one line and the pi sees a
+# falling edge when a sensor changes. open drain only ever pulls the line
+# down: it needs a pull-up. the pi's internal one (PUD_UP below) is enough
+# for short wires, add ~4.7k to 3.3V for long runs. never 5V.
+
+
+class RPiGpioEdgeSource:
+    # RPi.GPIO runs edge callbacks on its own polling thread, measured
+    # well under 1 ms on a pi 3
+    latency_ns = 1_000_000
+
+    def __init__(self, pin=17, bouncetime=None):
+        # imported here so the driver still loads on a machine without RPi.GPIO
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        self.pin = pin
+        self._callback = None
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        kwargs = {}
+        if bouncetime:
+            kwargs["bouncetime"] = bouncetime
+        GPIO.add_event_detect(pin, GPIO.FALLING, callback=self._on_edge, **kwargs)
+
+    def _on_edge(self, channel):
+        # runs on the RPi.GPIO event thread, keep it short
+        callback = self._callback
+        if callback:
+            callback(time.monotonic_ns())
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def asserted(self):
+        return self._gpio.input(self.pin) == 0
+
+    def close(self):
+        self._gpio.remove_event_detect(self.pin)
+        self._gpio.cleanup(self.pin)
+
+
+class SimEdgeSource:
+    """Edge source wired to a SimMCP23017 interrupt line (i2c_bus.sim_device)."""
+
+    # the listener runs in the thread that changed the pin
+    latency_ns = 0
+
+    def __init__(self, device, port=0):
+        self.device = device
+        self.port = port
+        self._callback = None
+        self.edges = 0
+        self._lock = threading.Lock()
+        device.add_int_listener(self._on_int)
+
+    def _on_int(self, port, asserted):
+        if port != self.port or not asserted:
+            return
+        with self._lock:
+            self.edges += 1
+        callback = self._callback
+        if callback:
+            callback(time.monotonic_ns())
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def asserted(self):
+        return self.device.int_asserted(self.port)
+
+    def close(self):
+        self._callback = None
@@ -0,0 +1,407 @@
+import os
+import random
+import threading
+import time
+
+
+# i2c backend
+#
+# on the pi this is just smbus2. with I2C_BACKEND=sim SMBus is a simulated
+# bus with register accurate MCP23017s on it, so the touch code runs without
+# hardware and every bus transaction can be counted.
+#
+# python3 LedStrip.py                                  -> real bus
+# I2C_BACKEND=sim LED_BACKEND=sim python3 LedStrip.py  -> all simulated
+#
+# any address 0x20-0x27 (the MCP23017 A2..A0 range) answers on the sim bus,
+# other addresses fail like a missing device does. get a chip with
+# sim_device(0x27) to drive its input pins, eg.
+#
+# chip = sim_device(0x27)
+# chip.play(TouchWaveform().tap(2, at=0.5, duration=0.3, bounce=3).events)
+#
+# each transaction takes as long as its clocks at I2C_SIM_HZ (default 100 kHz)
+# plus a fixed i2c-dev overhead. I2C_SIM_REALTIME=0 only adds up the time.
+
+I2C_BACKEND = os.environ.get("I2C_BACKEND", "hw")
+
+I2C_HZ = int(os.environ.get("I2C_SIM_HZ", "100000"))
+OVERHEAD_US = 60         # ioctl + driver cost per transaction on a pi 3
+
+MCP23017_ADDRS = range(0x20, 0x28)
+
+# register types, in BANK=0 order. BANK=0 address = type * 2 + port,
+# BANK=1 address = port * 0x10 + type
+IODIR, IPOL, GPINTEN, DEFVAL, INTCON, IOCON, GPPU, INTF, INTCAP, GPIO, OLAT = range(11)
+REGISTER_NAMES = ["IODIR", "IPOL", "GPINTEN", "DEFVAL", "INTCON", "IOCON",
+                  "GPPU", "INTF", "INTCAP", "GPIO", "OLAT"]
+
+# IOCON bits
+IOCON_BANK = 0x80
+IOCON_MIRROR = 0x40
+IOCON_SEQOP = 0x20
+IOCON_DISSLW = 0x10
+IOCON_HAEN = 0x08
+IOCON_ODR = 0x04
+IOCON_INTPOL = 0x02
+
+PORT_A = 0
+PORT_B = 1
+
+
+class SimMCP23017:
+    """One MCP23017. pins 0-7 are port A, 8-15 port B."""
+
+    def __init__(self, addr=0x27):
+        self.addr = addr
+        self._lock = threading.RLock()
+        # regs[type][port]
+        self.regs = [[0, 0] for _ in range(11)]
+        self.reset()
+        # what's driving the input pins from outside, per port
+        self.inputs = [0x00, 0x00]
+        # last value seen on each port, for interrupt-on-change
+        self._last = [0x00, 0x00]
+        # interrupt line listeners, called as fn(port, asserted)
+        self._int_listeners = []
+        self._int_out = [False, False]
+        self._player = None
+
+    def reset(self):
+        """Power-on reset values."""
+        with self._lock:
+            for reg in self.regs:
+                reg[0] = reg[1] = 0x00
+            self.regs[IODIR] = [0xFF, 0xFF]
+
+    # register addressing
+    @property
+    def bank(self):
+        return 1 if self.regs[IOCON][0] & IOCON_BANK else 0
+
+    def decode(self, reg_addr):
+        """Register address -> (type, port), or None for an unused address."""
+        if self.bank == 0:
+            if reg_addr > 0x15:
+                return None
+            return reg_addr >> 1, reg_addr & 1
+        port, reg_type = reg_addr >> 4, reg_addr & 0x0F
+        if port > 1 or reg_type > OLAT:
+            return None
+        return reg_type, port
+
+    def encode(self, reg_type, port):
+        if self.bank == 0:
+            return reg_type * 2 + port
+        return port * 0x10 + reg_type
+
+    def next_addr(self, reg_addr):
+        """Where the address pointer goes after a byte in a block transfer."""
+        iocon = self.regs[IOCON][0]
+        if iocon & IOCON_SEQOP:
+            # byte mode. BANK=0 toggles between the A/B pair, BANK=1 stays put
+            return reg_addr ^ 1 if self.bank == 0 else reg_addr
+        if self.bank == 0:
+            return (reg_addr + 1) % 0x16
+        reg_type, port = reg_addr & 0x0F, reg_addr >> 4
+        if reg_type < OLAT:
+            return reg_addr + 1
+        return 0x10 if port == 0 else 0x00
+
+    # register access
+    def read_register(self, reg_addr):
+        with self._lock:
+            decoded = self.decode(reg_addr)
+            if decoded is None:
+                return 0x00
+            reg_type, port = decoded
+            if reg_type == GPIO:
+                value = self.port_value(port)
+                self._clear_interrupt(port)
+                return value
+            if reg_type == INTCAP:
+                value = self.regs[INTCAP][port]
+                self._clear_interrupt(port)
+                return value
+            return self.regs[reg_type][port]
+
+    def write_register(self, reg_addr, value):
+        value &= 0xFF
+        with self._lock:
+            decoded = self.decode(reg_addr)
+            if decoded is None:
+                return
+            reg_type, port = decoded
+            if reg_type in (INTF, INTCAP):
+                return  # read only
+            if reg_type == GPIO:
+                reg_type = OLAT
+            if reg_type == IOCON:
+                # one IOCON shared by both ports
+                self.regs[IOCON] = [value, value]
+                self._update_int_lines()
+                return
+            self.regs[reg_type][port] = value
+            if reg_type in (IODIR, IPOL, GPINTEN, DEFVAL, INTCON, OLAT):
+                self._check_interrupts(port)
+
+    def port_value(self, port):
+        """What a GPIO read returns: inputs (with IPOL) and OLAT for outputs."""
+        iodir = self.regs[IODIR][port]
+        pins_in = (self.inputs[port] ^ self.regs[IPOL][port]) & iodir
+        return pins_in | (self.regs[OLAT][port] & ~iodir & 0xFF)
+
+    # outside world
+    def set_inputs(self, port, value):
+        with self._lock:
+            self.inputs[port] = value & 0xFF
+            self._check_interrupts(port)
+
+    def set_pin(self, pin, level):
+        port, bit = pin >> 3, 1 << (pin & 7)
+        with self._lock:
+            value = self.inputs[port] | bit if level else self.inputs[port] & ~bit
+            self.set_inputs(port, value)
+
+    def outputs(self, port):
+        """Levels the chip drives on its output pins."""
+        with self._lock:
+            return self.regs[OLAT][port] & ~self.regs[IODIR][port] & 0xFF
+
+    def add_int_listener(self, callback):
+        """callback(port, asserted) runs when INTA/INTB changes."""
+        self._int_listeners.append(callback)
+
+    def int_asserted(self, port):
+        return self._int_out[port]
+
+    def play(self, events, loop=False):
+        """Apply (seconds, pin, level) events on a thread, at their offsets from now."""
+        self.stop_playing()
+        stop = threading.Event()
+
+        def run():
+            while True:
+                start = time.monotonic()
+                for offset, pin, level in events:
+                    delay = start + offset - time.monotonic()
+                    if delay > 0 and stop.wait(delay):
+                        return
+                    if stop.is_set():
+                        return
+                    self.set_pin(pin, level)
+                if not loop:
+                    return
+
+        self._player = (stop, threading.Thread(target=run, daemon=True))
+        self._player[1].start()
+        return self._player[1]
+
+    def stop_playing(self):
+        if self._player is not None:
+            self._player[0].set()
+            self._player = None
+
+    # interrupts
+    def _check_interrupts(self, port):
+        """Called with _lock held after anything that can change a port."""
+        value = self.port_value(port)
+        enabled = self.regs[GPINTEN][port] & self.regs[IODIR][port]
+        intcon = self.regs[INTCON][port]
+        # INTCON=1 compares against DEFVAL, INTCON=0 against the last value
+        changed = (value ^ self._last[port]) & ~intcon
+        mismatch = (value ^ self.regs[DEFVAL][port]) & intcon
+        fired = (changed | mismatch) & enabled
+        self._last[port] = value
+        if fired:
+            if self.regs[INTF][port] == 0:
+                # INTCAP holds the port at the first interrupt until it's cleared
+                self.regs[INTCAP][port] = value
+            self.regs[INTF][port] |= fired
+            self._update_int_lines()
+
+    def _clear_interrupt(self, port):
+        if self.regs[INTF][port] == 0:
+            return
+        self.regs[INTF][port] = 0
+        self._update_int_lines()
+        # pins still different from DEFVAL interrupt again right away
+        value = self.port_value(port)
+        self._last[port] = value
+        mismatch = (value ^ self.regs[DEFVAL][port]) & self.regs[INTCON][port]
+        if mismatch & self.regs[GPINTEN][port] & self.regs[IODIR][port]:
+            self.regs[INTCAP][port] = value
+            self.regs[INTF][port] = mismatch & self.regs[GPINTEN][port]
+            self._update_int_lines()
+
+    def _update_int_lines(self):
+        pending = [self.regs[INTF][PORT_A] != 0, self.regs[INTF][PORT_B] != 0]
+        if self.regs[IOCON][0] & IOCON_MIRROR:
+            pending = [any(pending)] * 2
+        for port in (PORT_A, PORT_B):
+            if pending[port] != self._int_out[port]:
+                self._int_out[port] = pending[port]
+                for callback in self._int_listeners:
+                    callback(port, pending[port])
+
+
+class TouchWaveform:
+    """Builds a list of (seconds, pin, level) events for SimMCP23017.play()."""
+
+    def __init__(self, seed=None):
+        self.events = []
+        self._random = random.Random(seed)
+
+    def tap(self, pin, at, duration=0.2, bounce=0, bounce_s=0.001):
+        """Press pin at `at` for `duration`. bounce adds that many glitches on each edge."""
+        for edge_at, level in ((at, 1), (at + duration, 0)):
+            t = edge_at
+            for _ in range(bounce):
+                self.events.append((t, pin, level))
+                self.events.append((t + bounce_s / 2, pin, 1 - level))
+                t += bounce_s
+            self.events.append((t, pin, level))
+        self.events.sort(key=lambda e: e[0])
+        return self
+
+    def chord(self, pins, at, duration=1.0):
+        for pin in pins:
+            self.tap(pin, at, duration)
+        return self
+
+    def random_taps(self, pins, rate_hz, seconds, duration=(0.08, 0.4)):
+        """Poisson taps on random pins, like a player hammering the sensors."""
+        t = 0.0
+        while True:
+            t += self._random.expovariate(rate_hz)
+            if t >= seconds:
+                break
+            self.tap(self._random.choice(pins), t, self._random.uniform(*duration))
+        return self
+
+
+class SimI2CBus:
+    """State shared by every SimSMBus opened on the same bus id."""
+
+    def __init__(self, bus_hz=I2C_HZ, overhead_us=OVERHEAD_US, realtime=None):
+        self.devices = {}
+        self.bus_hz = bus_hz
+        self.overhead_ns = overhead_us * 1000
+        if realtime is None:
+            realtime = os.environ.get("I2C_SIM_REALTIME", "1") != "0"
+        self.realtime = realtime
+        # the kernel serializes transactions on one adapter
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_ns = 0
+        self.ops = {}
+        self.started_ns = time.monotonic_ns()
+
+    def device(self, addr):
+        if addr not in self.devices:
+            if addr not in MCP23017_ADDRS:
+                raise OSError(121, "Remote I/O error")
+            self.devices[addr] = SimMCP23017(addr)
+        return self.devices[addr]
+
+    def transaction(self, op, nbytes):
+        """Book the time for one transaction of nbytes on the wire (address byte included)."""
+        # 9 clocks per byte (8 bits + ack) plus start/stop
+        clocks = nbytes * 9 + 2
+        if op.startswith("read") and op != "read_byte":
+            clocks += 10  # repeated start + address byte again
+            nbytes += 1
+        ns = clocks * 1_000_000_000 // self.bus_hz + self.overhead_ns
+        self.transactions += 1
+        self.bytes += nbytes
+        self.busy_ns += ns
+        self.ops[op] = self.ops.get(op, 0) + 1
+        if self.realtime:
+            time.sleep(ns / 1e9)
+
+    def stats(self):
+        elapsed = max(1, time.monotonic_ns() - self.started_ns) / 1e9
+        return {
+            "transactions": self.transactions,
+            "transactions_per_s": self.transactions / elapsed,
+            "bytes": self.bytes,
+            "busy_ms": self.busy_ns / 1e6,
+            "utilization": self.busy_ns / 1e9 / elapsed,
+            "ops": dict(self.ops),
+        }
+
+
+_sim_buses = {}
+
+
+def sim_bus(bus_id=1):
+    if bus_id not in _sim_buses:
+        _sim_buses[bus_id] = SimI2CBus()
+    return _sim_buses[bus_id]
+
+
+def sim_device(addr=0x27, bus_id=1):
+    return sim_bus(bus_id).device(addr)
+
+
+class SimSMBus:
+    """The parts of smbus2.SMBus the touch code uses."""
+
+    def __init__(self, bus=None):
+        self.bus_id = bus
+        self.sim = sim_bus(bus)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def _device(self, addr):
+        if self.closed:
+            raise OSError(9, "Bad file descriptor")
+        return self.sim.device(addr)
+
+    def read_byte_data(self, i2c_addr, register, force=None):
+        with self.sim.lock:
+            dev = self._device(i2c_addr)
+            self.sim.transaction("read_byte_data", 3)
+            return dev.read_register(register)
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        with self.sim.lock:
+            dev = self._device(i2c_addr)
+            self.sim.transaction("write_byte_data", 3)
+            dev.write_register(register, value)
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        with self.sim.lock:
+            dev = self._device(i2c_addr)
+            self.sim.transaction("read_i2c_block_data", 2 + length)
+            data = []
+            for _ in range(length):
+                data.append(dev.read_register(register))
+                register = dev.next_addr(register)
+            return data
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        with self.sim.lock:
+            dev = self._device(i2c_addr)
+            self.sim.transaction("write_i2c_block_data", 2 + len(data))
+            for value in data:
+                dev.write_register(register, value)
+                register = dev.next_addr(register)
+
+
+if I2C_BACKEND == "sim":
+    SMBus = SimSMBus
+else:
+    from smbus2 import SMBus
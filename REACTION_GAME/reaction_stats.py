@@ -0,0 +1,204 @@
+import math
+
+
+# streaming reaction time statistics
+#
+# every trial updates a few running numbers and is then forgotten, so memory
+# stays the same after a day or after months and a summary never has to
+# sort the history:
+#   RunningStats  count, mean and variance (Welford), min, max
+#   P2Quantile    one quantile estimated with 5 markers (the P² algorithm,
+#                 Jain & Chlamtac 1985). exact for the first exact_until
+#                 trials, which also place the markers much better than 5 would
+#   Ewma          exponentially weighted mean, the recent trend
+# ReactionStats bundles them for one stream of reaction times and
+# ReactionTracker keeps one per sensor, per session and overall.
+#
+# tracker = ReactionTracker()
+# tracker.start_session()
+# tracker.add_trial(sensor_index=2, reaction_s=0.412)
+# print(tracker.summary())
+
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def variance(self):
+        """Sample variance, 0 with fewer than 2 values."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    def __init__(self, p, exact_until=50):
+        self.p = p
+        # the first values are kept as they are until the markers are placed
+        self._first = []
+        self.exact_until = max(5, exact_until)
+        self.step = [0, p / 2, p, (1 + p) / 2, 1]
+        self.q = None     # marker heights
+        self.n = None     # marker positions
+        self.want = None  # desired marker positions
+
+    def _place_markers(self):
+        values = sorted(self._first)
+        self._first = None
+        last = len(values) - 1
+        self.want = [last * step for step in self.step]
+        self.n = [int(round(want)) for want in self.want]
+        # positions have to be strictly increasing
+        for i in (1, 2, 3):
+            self.n[i] = min(max(self.n[i], self.n[i - 1] + 1), last - (4 - i))
+        self.q = [float(values[i]) for i in self.n]
+
+    def add(self, x):
+        if self._first is not None:
+            self._first.append(x)
+            if len(self._first) > self.exact_until:
+                self._place_markers()
+            return
+
+        q, n = self.q, self.n
+        # cell the value falls in, stretching the ends if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.want[i] += self.step[i]
+
+        # move the middle markers towards where they should be
+        for i in (1, 2, 3):
+            d = self.want[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        """The estimate, or the exact quantile of the first values. None if empty."""
+        if self._first is not None:
+            if not self._first:
+                return None
+            values = sorted(self._first)
+            return values[int(round(self.p * (len(values) - 1)))]
+        return self.q[2]
+
+
+class Ewma:
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def add(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+
+
+class ReactionStats:
+    """Everything kept for one stream of reaction times, in seconds."""
+
+    def __init__(self, quantiles=(0.5, 0.9)):
+        self.running = RunningStats()
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+        self.trend = Ewma()
+        self.wrong_touches = 0
+
+    def add(self, reaction_s):
+        self.running.add(reaction_s)
+        for quantile in self.quantiles.values():
+            quantile.add(reaction_s)
+        self.trend.add(reaction_s)
+
+    @property
+    def count(self):
+        return self.running.count
+
+    def summary(self):
+        running = self.running
+        summary = {"trials": running.count, "wrong_touches": self.wrong_touches}
+        if running.count:
+            summary.update(mean=running.mean, stdev=running.stdev, min=running.min,
+                           max=running.max, trend=self.trend.value)
+            for p, quantile in self.quantiles.items():
+                summary[f"p{int(p * 100)}"] = quantile.value()
+        return summary
+
+
+class ReactionTracker:
+    def __init__(self, quantiles=(0.5, 0.9)):
+        self._quantiles = quantiles
+        self.overall = ReactionStats(quantiles)
+        self.by_sensor = {}
+        self.session = None
+        self.session_by_sensor = {}
+        self.sessions = 0
+
+    def start_session(self):
+        """New per session numbers, the overall and per sensor ones carry on."""
+        self.session = ReactionStats(self._quantiles)
+        self.session_by_sensor = {}
+        self.sessions += 1
+
+    def _streams(self, sensor_index):
+        if self.session is None:
+            self.start_session()
+        if sensor_index not in self.by_sensor:
+            self.by_sensor[sensor_index] = ReactionStats(self._quantiles)
+        if sensor_index not in self.session_by_sensor:
+            self.session_by_sensor[sensor_index] = ReactionStats(self._quantiles)
+        return (self.overall, self.session, self.by_sensor[sensor_index],
+                self.session_by_sensor[sensor_index])
+
+    def add_trial(self, sensor_index, reaction_s):
+        for stats in self._streams(sensor_index):
+            stats.add(reaction_s)
+
+    def add_wrong_touch(self, sensor_index):
+        for stats in self._streams(sensor_index):
+            stats.wrong_touches += 1
+
+    def summary(self):
+        return {"overall": self.overall.summary(),
+                "session": self.session.summary() if self.session else None,
+                "by_sensor": {i: s.summary() for i, s in sorted(self.by_sensor.items())},
+                "session_by_sensor": {i: s.summary()
+                                      for i, s in sorted(self.session_by_sensor.items())}}
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+# one thread that runs timed callbacks for everything on a station
+# (led expiry and frame rate cap, combo hold timer, game delays)
+# instead of every component starting its own thread and sleeping.
+#
+# deadlines are time.monotonic() seconds so NTP jumps don't move them.
+# callbacks run on the scheduler thread one after another, so keep them
+# short and never sleep in them. schedule another callback instead.
+#
+# eg.
+# scheduler = Scheduler()
+# scheduler.start()
+# timer = scheduler.call_later(0.2, print, "200 ms later")
+# timer.cancel()
+
+
+class Timer:
+    """Handle returned by the call_* methods. cancel() before it fires to drop it."""
+
+    __slots__ = ("deadline", "interval", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    def __init__(self):
+        # heap of (deadline, seq, timer). seq keeps equal deadlines in order
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._running = False
+            self._cond.notify()
+        if thread is not threading.current_thread():
+            thread.join()
+        with self._cond:
+            self._thread = None
+
+    def call_at(self, deadline, callback, *args):
+        """Run callback(*args) at monotonic time deadline."""
+        return self._push(Timer(deadline, None, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        return self.call_at(time.monotonic(), callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) every interval seconds until the timer is cancelled."""
+        return self._push(Timer(time.monotonic() + interval, interval, callback, args))
+
+    def pending(self):
+        """Number of timers waiting, including cancelled ones not popped yet."""
+        with self._cond:
+            return len(self._heap)
+
+    def _push(self, timer):
+        with self._cond:
+            heapq.heappush(self._heap, (timer.deadline, next(self._seq), timer))
+            # only wake the thread if this is the new earliest deadline
+            if self._heap[0][2] is timer:
+                self._cond.notify()
+        return timer
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    # drop cancelled timers off the top
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        # nothing scheduled, sleep until something is
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+
+                _, _, timer = heapq.heappop(self._heap)
+                if timer.interval is not None:
+                    # reschedule from the deadline, not from now, so it doesn't drift
+                    timer.deadline += timer.interval
+                    heapq.heappush(self._heap, (timer.deadline, next(self._seq), timer))
+
+            # run the callback without holding the lock so it can schedule more
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"[SCHEDULER] callback {timer.callback} failed: {e}")
@@ -0,0 +1,204 @@
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# results on disk
+#
+# every trial and every finished game goes into a sqlite database. the game
+# only puts a tuple on a queue, a writer thread takes whatever has piled up
+# and writes it in one transaction, so the SD card is never on the touch
+# path and a burst of trials is one fsync instead of one each.
+#
+# WAL mode lets queries read while the writer writes. trials are indexed by
+# (player, ts) and ts, so one player's history or one day stays a range scan
+# after a year of data.
+#
+# store = SessionStore("reaction.db")
+# session = store.start_session("anna", tries=10)
+# store.add_trial(session, "anna", sensor=2, led_index=23, reaction_ns=412_000_000)
+# store.end_session(session, trials=10, wrong_touches=3, mean_ns=450_000_000)
+# store.player_trials("anna", since=time.time() - 30 * 86400)
+# store.close()
+#
+# uncertainty_ns is -1 when it isn't known (a touch that came without a
+# timestamp), so keep it out of averages with WHERE uncertainty_ns >= 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session       TEXT PRIMARY KEY,
+    player        TEXT NOT NULL,
+    started_at    REAL NOT NULL,
+    ended_at      REAL,
+    tries         INTEGER,
+    trials        INTEGER,
+    wrong_touches INTEGER,
+    mean_ns       INTEGER
+);
+CREATE TABLE IF NOT EXISTS trials (
+    id             INTEGER PRIMARY KEY,
+    session        TEXT NOT NULL,
+    player         TEXT NOT NULL,
+    ts             REAL NOT NULL,
+    sensor         INTEGER NOT NULL,
+    led_index      INTEGER NOT NULL,
+    reaction_ns    INTEGER NOT NULL,
+    uncertainty_ns INTEGER NOT NULL DEFAULT 0,
+    wrong_touches  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS trials_player_ts ON trials (player, ts);
+CREATE INDEX IF NOT EXISTS trials_ts ON trials (ts);
+CREATE INDEX IF NOT EXISTS sessions_player_started ON sessions (player, started_at);
+"""
+
+_INSERT_TRIAL = ("INSERT INTO trials (session, player, ts, sensor, led_index, reaction_ns,"
+                 " uncertainty_ns, wrong_touches) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+_INSERT_SESSION = ("INSERT OR REPLACE INTO sessions (session, player, started_at, tries)"
+                   " VALUES (?, ?, ?, ?)")
+_END_SESSION = ("UPDATE sessions SET ended_at = ?, trials = ?, wrong_touches = ?, mean_ns = ?"
+                " WHERE session = ?")
+
+_STOP = object()
+
+
+class SessionStore:
+    def __init__(self, path="reaction.db", batch_size=256, flush_s=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        # how long the writer waits for more rows before writing a batch
+        self.flush_s = flush_s
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_thread, daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only syncs at checkpoints, enough for game results
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Writes. these only queue, never touch the disk
+    def start_session(self, player, tries=None):
+        """Returns the new session id."""
+        session = uuid.uuid4().hex
+        self._queue.put((_INSERT_SESSION, (session, player, time.time(), tries)))
+        return session
+
+    def end_session(self, session, trials, wrong_touches, mean_ns=None):
+        self._queue.put((_END_SESSION, (time.time(), trials, wrong_touches, mean_ns, session)))
+
+    def add_trial(self, session, player, sensor, led_index, reaction_ns,
+                  uncertainty_ns=0, wrong_touches=0, ts=None):
+        if ts is None:
+            ts = time.time()
+        self._queue.put((_INSERT_TRIAL, (session, player, ts, sensor, led_index,
+                                         int(reaction_ns), int(uncertainty_ns), wrong_touches)))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written."""
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def close(self):
+        self._queue.put((_STOP, None))
+        self._writer.join()
+
+    def _writer_thread(self):
+        conn = self._connect()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_s
+            # gather more until the batch is full or flush_s is up, unless
+            # someone is waiting on flush() or close()
+            while len(batch) < self.batch_size and batch[-1][0] not in (None, _STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            rows = []
+            waiters = []
+            for sql, params in batch:
+                if sql is _STOP:
+                    running = False
+                elif sql is None:
+                    waiters.append(params)
+                else:
+                    rows.append((sql, params))
+            if rows:
+                self._write(conn, rows)
+            for done in waiters:
+                done.set()
+        conn.close()
+
+    def _write(self, conn, rows):
+        try:
+            with conn:
+                # same statement back to back goes in as one executemany
+                start = 0
+                while start < len(rows):
+                    sql = rows[start][0]
+                    end = start
+                    while end < len(rows) and rows[end][0] == sql:
+                        end += 1
+                    conn.executemany(sql, [params for _, params in rows[start:end]])
+                    start = end
+            self.written += len(rows)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"[STORE] writing {len(rows)} rows failed: {e}")
+
+    # Queries. each opens its own connection, WAL lets them run while the
+    # writer is busy
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def players(self):
+        return [row["player"] for row in
+                self._query("SELECT DISTINCT player FROM sessions ORDER BY player")]
+
+    def player_trials(self, player, since=None, until=None):
+        """A player's trials between two time.time() values, oldest first."""
+        return self._query(
+            "SELECT * FROM trials WHERE player = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (player, since or 0, until or float("inf")))
+
+    def trials_between(self, since, until):
+        """Every player's trials between two time.time() values."""
+        return self._query("SELECT * FROM trials WHERE ts >= ? AND ts < ? ORDER BY ts",
+                           (since, until))
+
+    def player_sessions(self, player, since=None):
+        return self._query(
+            "SELECT * FROM sessions WHERE player = ? AND started_at >= ? ORDER BY started_at",
+            (player, since or 0))
+
+    def daily_summary(self, player, since=None):
+        """Per local day: trials, mean reaction and wrong touches."""
+        return self._query(
+            "SELECT date(ts, 'unixepoch', 'localtime') AS day, COUNT(*) AS trials,"
+            " AVG(reaction_ns) / 1e9 AS mean_s, SUM(wrong_touches) AS wrong_touches"
+            " FROM trials WHERE player = ? AND ts >= ? GROUP BY day ORDER BY day",
+            (player, since or 0))
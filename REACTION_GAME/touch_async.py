@@ -0,0 +1,133 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from TouchSensor import MCP23017TouchLED
+
+
+# asyncio front end for MCP23017TouchLED, so a station can run the game,
+# the led strip and the touch sensors on one event loop
+#
+# all smbus calls stay off the loop: setup and cleanup run on a one-thread
+# executor and everything after start() runs on the driver's bus thread.
+# touch events come back through loop.call_soon_threadsafe, nothing polls.
+#
+# async def main():
+#     sensors = await AsyncMCP23017TouchLED.create(sensor_pins=[2, 3, 4, 5], led_pins=[1])
+#     sensors.start()
+#     async for event in sensors.events():
+#         print(event)
+
+
+class AsyncMCP23017TouchLED:
+    def __init__(self, driver, loop, executor):
+        self.driver = driver
+        self._loop = loop
+        self._executor = executor
+        # one queue per events() consumer, every event goes to all of them
+        self._subscribers = set()
+        # (sensor_indices, pressed, future) from wait_for()
+        self._waiters = []
+        driver.set_event_callback(self._on_event_thread)
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """Build the driver (it configures the chips) without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mcp23017")
+        driver = await loop.run_in_executor(
+            executor, lambda: MCP23017TouchLED(*args, **kwargs))
+        return cls(driver, loop, executor)
+
+    def start(self):
+        self.driver.start()
+
+    async def close(self):
+        await self._loop.run_in_executor(self._executor, self.driver.cleanup)
+        self._executor.shutdown(wait=False)
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    # Events
+    def _on_event_thread(self, event):
+        # dispatcher thread -> loop
+        self._loop.call_soon_threadsafe(self._on_event, event)
+
+    def _on_event(self, event):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+        still_waiting = []
+        for sensor_indices, pressed, future in self._waiters:
+            if future.done():
+                continue
+            if event.sensor_index in sensor_indices and (pressed is None or event.pressed == pressed):
+                future.set_result(event)
+            else:
+                still_waiting.append((sensor_indices, pressed, future))
+        self._waiters = still_waiting
+
+    async def events(self):
+        """async for event in sensors.events(). Every consumer sees every event."""
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    async def wait_for(self, sensor_indices, timeout=None, pressed=True):
+        """Next event on any of sensor_indices. pressed=None takes releases too.
+
+        Raises asyncio.TimeoutError if nothing comes within timeout seconds.
+        """
+        future = self._loop.create_future()
+        self._waiters.append((set(sensor_indices), pressed, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            future.cancel()
+
+    # LEDs and registers
+    def _done_callback(self):
+        future = self._loop.create_future()
+
+        def done():
+            self._loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        return future, done
+
+    async def set_led(self, index, on=True):
+        """Returns once the chip is driving the new value."""
+        future, done = self._done_callback()
+        self.driver.set_led(index, on, callback=done)
+        await future
+
+    async def write_register(self, register, value, addr=None):
+        future, done = self._done_callback()
+        self.driver.write_register(register, value, callback=done, addr=addr)
+        await future
+
+    @property
+    def touched(self):
+        return self.driver.touched
+
+
+async def main():
+    sensors = await AsyncMCP23017TouchLED.create(sensor_pins=[2, 3, 4, 5], led_pins=[1])
+    sensors.start()
+    try:
+        async for event in sensors.events():
+            state = "PRESSED" if event.pressed else "RELEASED"
+            print(f"[ASYNC] Sensor {event.sensor_index} {state}")
+    finally:
+        await sensors.close()
+
+
+# Main
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Exiting...")
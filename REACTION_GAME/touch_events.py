@@ -0,0 +1,103 @@
+import threading
+from collections import namedtuple
+
+
+# touch events between the bus thread and whoever consumes them
+#
+# the bus thread pushes every edge it sees into a preallocated ring and goes
+# straight back to scanning. it never takes a lock the consumer holds and
+# never waits for it: if the ring is full the event is dropped and counted
+# in overflows. one consumer (the driver's dispatcher thread, or a loop over
+# events()) takes them out in order.
+#
+# single producer / single consumer. head is only written by the producer
+# and tail only by the consumer, and each slot is filled before head moves
+# past it, so no lock is needed around the slots.
+
+# the edge happened somewhere in (timestamp_ns - window_ns, timestamp_ns]
+TouchEvent = namedtuple("TouchEvent", ["sensor_index", "pressed", "timestamp_ns", "raw",
+                                       "window_ns"])
+
+
+class TouchEventRing:
+    def __init__(self, capacity=1024):
+        # power of two so the slot is head & mask
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+
+        self._sensor_index = [0] * size
+        self._pressed = [False] * size
+        self._timestamp_ns = [0] * size
+        self._raw = [0] * size
+        self._window_ns = [0] * size
+
+        self._head = 0  # next slot to write, producer only
+        self._tail = 0  # next slot to read, consumer only
+        self.overflows = 0
+        self.pushed = 0
+        self._closed = False
+        # wakes a waiting consumer. set() never blocks on the consumer
+        self._ready = threading.Event()
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, sensor_index, pressed, timestamp_ns, raw, window_ns=0):
+        """Producer. Returns False (and counts an overflow) if the ring is full."""
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.overflows += 1
+            return False
+        slot = head & self._mask
+        self._sensor_index[slot] = sensor_index
+        self._pressed[slot] = pressed
+        self._timestamp_ns[slot] = timestamp_ns
+        self._raw[slot] = raw
+        self._window_ns[slot] = window_ns
+        # publish only after the slot is complete
+        self._head = head + 1
+        self.pushed += 1
+        self._ready.set()
+        return True
+
+    def pop(self):
+        """Consumer. Next event or None if the ring is empty."""
+        tail = self._tail
+        if tail == self._head:
+            return None
+        slot = tail & self._mask
+        event = TouchEvent(self._sensor_index[slot], self._pressed[slot],
+                           self._timestamp_ns[slot], self._raw[slot],
+                           self._window_ns[slot])
+        self._tail = tail + 1
+        return event
+
+    def get(self, timeout=None):
+        """Consumer. Wait for the next event. None on timeout or once closed and drained."""
+        while True:
+            event = self.pop()
+            if event is not None:
+                return event
+            if self._closed:
+                return None
+            self._ready.clear()
+            # an event pushed between pop() and clear() would be missed otherwise
+            if self._tail != self._head:
+                continue
+            if not self._ready.wait(timeout) and self._tail == self._head:
+                return None
+
+    def events(self, timeout=None):
+        """Blocking iterator. Ends on close() or when timeout passes with no event."""
+        while True:
+            event = self.get(timeout)
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
@@ -0,0 +1,166 @@
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# record and replay of raw MCP23017 samples
+#
+# the driver hands every raw scan to a TouchRecorder before debouncing, so a
+# recording holds exactly what the chips said and when. replaying it into a
+# driver goes through the same debounce/edge/event path, which makes a
+# misbehaving station reproducible on any machine.
+#
+# file: a 32 byte header, then fixed size little endian records
+#   timestamp_ns  int64   time.monotonic_ns() of the sample
+#   window_ns     int64   see #events in TouchSensor.py
+#   raw_lo        uint64  scan bits 0-63 (chips 0-3)
+#   raw_hi        uint64  scan bits 64-127 (chips 4-7)
+# so TouchRecording can np.memmap it and index any sample without reading
+# the whole thing.
+#
+# touch_led.record("station3.mcprec")
+# ...
+# touch_led.stop_recording()
+#
+# replay = MCP23017TouchLED(sensor_pins=[2, 3, 4, 5], led_pins=[])
+# replay.set_event_callback(print)
+# replay.start(scan=False)   # no bus thread, the samples come from the file
+# play(TouchRecording("station3.mcprec"), replay, realtime=False)
+
+MAGIC = b"MCPREC\x00\x01"
+# magic, record size, chips, monotonic_ns when recording started
+HEADER = struct.Struct("<8sIIq8x")
+RECORD = struct.Struct("<qqQQ")
+RECORD_DTYPE = np.dtype([("timestamp_ns", "<i8"), ("window_ns", "<i8"),
+                         ("raw_lo", "<u8"), ("raw_hi", "<u8")])
+
+_LOW_BITS = (1 << 64) - 1
+
+
+class TouchRecorder:
+    """Appends samples to a recording. Only one thread (the bus thread) writes.
+
+    write() only packs the sample into a buffer, the driver calls it under
+    its lock. full buffers go to a writer thread, so the SD card never holds
+    up a scan.
+    """
+
+    def __init__(self, path, chips=1, flush_every=256):
+        self.path = path
+        self.samples = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, RECORD.size, chips, time.monotonic_ns()))
+        self._buffer = bytearray()
+        self._flush_every = flush_every
+        self._closed = False
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_thread, daemon=True)
+        self._writer.start()
+
+    def write(self, timestamp_ns, window_ns, raw):
+        if self._closed:
+            return
+        self._buffer += RECORD.pack(timestamp_ns, window_ns, raw & _LOW_BITS, raw >> 64)
+        self.samples += 1
+        if self.samples % self._flush_every == 0:
+            self._queue.put((self._buffer, None))
+            self._buffer = bytearray()
+
+    def flush(self, timeout=None):
+        """Hand over what's buffered and wait until it's in the file."""
+        done = threading.Event()
+        buffer, self._buffer = self._buffer, bytearray()
+        self._queue.put((buffer, done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put((None, None))
+        self._writer.join()
+        self._file.close()
+
+    def _writer_thread(self):
+        while True:
+            buffer, done = self._queue.get()
+            if buffer is None:
+                return
+            if buffer:
+                self._file.write(buffer)
+            if done is not None:
+                self._file.flush()
+                done.set()
+
+
+class TouchRecording:
+    """A recording file, memory mapped. records is a numpy structured array."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            f.seek(0, 2)
+            size = f.tell()
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path}: too short for a recording")
+        magic, record_size, self.chips, self.started_ns = HEADER.unpack(header)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path}: not a touch recording")
+        # a station that died mid write leaves a partial record at the end
+        count = (size - HEADER.size) // RECORD.size
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                                     offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def duration_s(self):
+        if len(self.records) < 2:
+            return 0.0
+        return (int(self.records["timestamp_ns"][-1]) - int(self.records["timestamp_ns"][0])) / 1e9
+
+    def samples(self, start=0, stop=None):
+        """(timestamp_ns, window_ns, raw) for records[start:stop]."""
+        chunk = self.records[start:stop]
+        for ts, window, lo, hi in zip(chunk["timestamp_ns"].tolist(), chunk["window_ns"].tolist(),
+                                      chunk["raw_lo"].tolist(), chunk["raw_hi"].tolist()):
+            yield ts, window, lo | (hi << 64)
+
+
+def play(recording, touch_led, realtime=True):
+    """Feed a recording into touch_led.inject_sample(). Blocks until done.
+
+    Timestamps are moved to now, keeping the gaps between them, so debounce
+    sees the same intervals as the station did. realtime also sleeps out
+    those gaps, otherwise the samples go in as fast as the dispatcher takes
+    the events. Returns {"samples", "events", "seconds"}.
+    """
+    if not len(recording):
+        return {"samples": 0, "events": 0, "seconds": 0.0}
+    ring = touch_led.ring
+    # leave room so a burst of edges never overflows the ring
+    high_water = ring.capacity - 64
+
+    start_ns = time.monotonic_ns()
+    first_ns = int(recording.records["timestamp_ns"][0])
+    events = 0
+    for timestamp_ns, window_ns, raw in recording.samples():
+        offset_ns = timestamp_ns - first_ns
+        if realtime:
+            delay = (start_ns + offset_ns - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            while len(ring) > high_water:
+                time.sleep(0.0005)
+        events += touch_led.inject_sample(raw, start_ns + offset_ns, window_ns)
+    return {"samples": len(recording), "events": events,
+            "seconds": (time.monotonic_ns() - start_ns) / 1e9}
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+
+
+# led strip backend
+#
+# on the pi this is just rpi_ws281x. with LED_BACKEND=sim it is a software
+# PixelStrip so the led code runs (and can be benchmarked) on any linux box.
+#
+# python3 LedStrip.py                     -> real strip, needs sudo
+# LED_BACKEND=sim python3 LedStrip.py     -> simulated strip
+#
+# the one copy for both projects. LED_CLOCK's scripts (led_thread.py,
+# led_async.py) add this directory to sys.path before importing it.
+#
+# the sim models the ws281x timing. each led is 24 bits at 800 kHz = 30 us,
+# followed by the reset latch. like the real driver, show() first waits for
+# the previous transfer to finish, then starts the new one and returns.
+# LED_SIM_REALTIME=0 skips the waiting and only adds up the time.
+
+LED_BACKEND = os.environ.get("LED_BACKEND", "hw")
+
+US_PER_LED = 30          # 24 bits * 1.25 us
+RESET_US = 300           # latch time, ws2812b needs at least 280 us
+
+SimFrame = namedtuple("SimFrame", ["timestamp_ns", "pixels"])
+
+
+def SimColor(red, green, blue, white=0):
+    """Same packing as rpi_ws281x.Color."""
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+class SimPixelStrip:
+    def __init__(self, num, pin, freq_hz=800000, dma=10, invert=False,
+                 brightness=255, channel=0, strip_type=None, gamma=None,
+                 history=256, realtime=None):
+        self.num = num
+        self.pin = pin
+        self.freq_hz = freq_hz
+        self.brightness = brightness
+        self._buf = array("I", [0] * num)
+        self._begun = False
+        if realtime is None:
+            realtime = os.environ.get("LED_SIM_REALTIME", "1") != "0"
+        self.realtime = realtime
+
+        # one transfer takes this long on the wire
+        self.transfer_ns = int((US_PER_LED * 800000 / freq_hz * num + RESET_US) * 1000)
+        self._busy_until_ns = 0
+        self._lock = threading.Lock()
+
+        # last committed frames, newest at the end
+        self.frames = deque(maxlen=history)
+        self.show_count = 0
+        # time show() spent waiting for the previous transfer
+        self.wait_ns = 0
+        # time the wire was busy in total
+        self.busy_ns = 0
+
+    def begin(self):
+        self._begun = True
+
+    def numPixels(self):
+        return self.num
+
+    def setPixelColor(self, n, color):
+        self._buf[n] = color
+
+    def setPixelColorRGB(self, n, red, green, blue, white=0):
+        self._buf[n] = SimColor(red, green, blue, white)
+
+    def getPixelColor(self, n):
+        return self._buf[n]
+
+    def getPixels(self):
+        return self._buf
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+
+    def getBrightness(self):
+        return self.brightness
+
+    def show(self):
+        if not self._begun:
+            raise RuntimeError("show() before begin()")
+        with self._lock:
+            now = time.monotonic_ns()
+            if now < self._busy_until_ns:
+                wait = self._busy_until_ns - now
+                self.wait_ns += wait
+                if self.realtime:
+                    time.sleep(wait / 1e9)
+                    now = time.monotonic_ns()
+                else:
+                    now = self._busy_until_ns
+            self._busy_until_ns = now + self.transfer_ns
+            self.busy_ns += self.transfer_ns
+            self.show_count += 1
+            self.frames.append(SimFrame(now, array("I", self._buf)))
+
+    # helpers for tests and benchmarks
+    def last_frame(self):
+        return self.frames[-1] if self.frames else None
+
+    def frame_intervals_ms(self):
+        """Time between consecutive recorded frames."""
+        times = [f.timestamp_ns for f in self.frames]
+        return [(b - a) / 1e6 for a, b in zip(times, times[1:])]
+
+    def stats(self):
+        return {
+            "shows": self.show_count,
+            "busy_ms": self.busy_ns / 1e6,
+            "wait_ms": self.wait_ns / 1e6,
+            "transfer_us": self.transfer_ns / 1000,
+        }
+
+
+if LED_BACKEND == "sim":
+    PixelStrip = SimPixelStrip
+    Color = SimColor
+else:
+    from rpi_ws281x import PixelStrip, Color